@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import zipfile
+from functools import partial
+from pathlib import Path, PurePosixPath
+from executor import JobTimeout, PoolSaturated, WorkerPool, WORKER_COUNT, deadline
+from image_processor import normalize_format
+from pipeline import EditPipeline, decode_bytes, encode_array, run_stages
+
+
+# Nombre d'images traitées simultanément par un lot : seules ces images (fichier source, tableau
+# décodé, résultat encodé) sont en mémoire, quelle que soit la taille du lot
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", WORKER_COUNT))
+# Délai (en secondes) avant de soumettre à nouveau une image quand le pool de travail est saturé
+BATCH_RETRY_DELAY = 0.05
+
+# Extensions des fichiers traités dans une archive ou un dossier (les autres sont ignorés)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+
+# Formats de sortie d'un lot
+BATCH_OUTPUTS = ("zip", "ndjson")
+
+
+def is_image_name(name):
+    path = PurePosixPath(name)
+    return path.suffix.lower() in IMAGE_EXTENSIONS and not any(part.startswith(".") for part in path.parts)
+
+
+# Nom d'une entrée d'archive ramené à un chemin relatif sûr (sans "..", ni racine, ni "__MACOSX")
+def safe_name(name):
+    parts = [part for part in PurePosixPath(name.replace("\\", "/")).parts if part not in ("", "/", ".", "..")]
+    if not parts or parts[0] == "__MACOSX":
+        return None
+    return "/".join(parts)
+
+
+# Images d'une archive ZIP déjà ouverte : (nom, fonction de lecture des octets).
+# Les octets ne sont lus qu'au moment du traitement de l'image ; l'archive doit rester ouverte
+# jusqu'à la fin du lot
+def iter_zip(archive):
+    for info in archive.infolist():
+        name = safe_name(info.filename)
+        if info.is_dir() or name is None or not is_image_name(name):
+            continue
+        yield name, partial(archive.read, info)
+
+
+# Images d'un dossier et de ses sous-dossiers, dans l'ordre alphabétique
+def iter_directory(directory):
+    root = Path(directory)
+    for path in sorted(root.rglob("*")):
+        name = path.relative_to(root).as_posix()
+        if path.is_file() and is_image_name(name):
+            yield name, path.read_bytes
+
+
+# Nom du fichier résultat : le chemin de l'image source, suivi de l'extension du format de sortie
+# si celle de la source ne le désigne pas déjà (a.png -> a.png.webp, a.jpg reste a.jpg en JPEG).
+# L'extension source est gardée pour que deux images (a.png et a.jpg) ne donnent pas le même nom
+def output_name(name, image_format):
+    suffix = PurePosixPath(name).suffix
+    if suffix and normalize_format(suffix[1:]) == image_format:
+        return name
+    return f"{name}.{image_format.lower()}"
+
+
+# Rendre un nom de résultat unique parmi ceux déjà utilisés par le lot (a.png, a-1.png, a-2.png...).
+# La comparaison ignore la casse, pour les systèmes de fichiers qui ne la distinguent pas
+def unique_name(name, used):
+    path = PurePosixPath(name)
+    candidate, n = name, 1
+    while candidate.lower() in used:
+        candidate = str(path.with_name(f"{path.stem}-{n}{path.suffix}"))
+        n += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+# Fonction de calcul exécutée par le pool de travail : décoder, éditer et encoder une image.
+# Renvoie (image encodée, format, largeur, hauteur)
+def process_image(image_bytes, stages, output_format=None, quality=None, compression=None, as_base64=False):
+    array, image_format = decode_bytes(image_bytes)
+    outputs = run_stages(array, image_format, stages)
+    if outputs:
+        array = outputs[-1]
+    output_format = normalize_format(output_format or image_format)
+    data = encode_array(array, image_format, output_format, quality, compression, as_base64)
+    height, width = array.shape[:2]
+    return data, output_format, width, height
+
+
+# Soumettre une tâche au pool en attendant qu'une place se libère s'il est saturé
+# (le lot partage le pool avec les requêtes interactives sans jamais les faire échouer).
+# La tâche a sa propre échéance : un lot dure bien plus longtemps qu'une requête, et l'attente
+# d'une place libre n'est pas comptée
+async def submit(pool, func, *args, **kwargs):
+    while True:
+        try:
+            with deadline(pool.timeout):
+                return await pool.run(func, *args, **kwargs)
+        except PoolSaturated:
+            await asyncio.sleep(BATCH_RETRY_DELAY)
+
+
+# Traiter une image du lot ; renvoie (statut, image encodée ou None en cas d'erreur)
+async def run_entry(pool, name, read, stages, options):
+    try:
+        image_bytes = await asyncio.to_thread(read)
+        data, image_format, width, height = await submit(pool, process_image, image_bytes, stages, **options)
+    except JobTimeout:
+        return {"name": name, "status": "error", "error": "Le traitement de l'image a pris trop de temps"}, None
+    except OSError:
+        return {"name": name, "status": "error", "error": "Format d'image non pris en charge"}, None
+    except Exception as e:
+        # Une image illisible ou invalide ne doit pas interrompre le reste du lot
+        return {"name": name, "status": "error", "error": str(e) or type(e).__name__}, None
+
+    status = {"name": name, "status": "ok", "output": output_name(name, image_format), "format": image_format,
+              "width": width, "height": height}
+    return status, data
+
+
+# Appliquer les étapes à toutes les images du lot, au plus `concurrency` à la fois.
+# Générateur asynchrone de (statut, image encodée), dans l'ordre de fin de traitement : chaque
+# résultat est renvoyé dès qu'il est prêt et une nouvelle image n'est lue qu'une fois qu'une place
+# est libre, ce qui borne la mémoire utilisée. Le nom de chaque résultat ("output" du statut) est
+# unique dans le lot. Options : voir process_image
+async def run_batch(entries, stages, pool, concurrency=BATCH_CONCURRENCY, **options):
+    pending = set()
+    used = set()
+
+    def finish(task):
+        status, data = task.result()
+        if data is not None:
+            status["output"] = unique_name(status["output"], used)
+        return status, data
+
+    try:
+        for name, read in entries:
+            while len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield finish(task)
+            pending.add(asyncio.ensure_future(run_entry(pool, name, read, stages, options)))
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield finish(task)
+    finally:
+        # Lot interrompu (client déconnecté) : abandonner les images en cours
+        for task in pending:
+            task.cancel()
+
+
+# Destination en écriture seule pour zipfile : les octets écrits sont récupérés au fur et à mesure
+# pour être envoyés au client, sans jamais garder l'archive entière en mémoire
+class ChunkWriter:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+# Résultats d'un lot en archive ZIP : une entrée par image réussie, puis le statut de
+# chaque image (une ligne JSON par image) dans status.ndjson à la fin de l'archive
+async def zip_stream(results):
+    writer = ChunkWriter()
+    statuses = []
+    # Les images sont déjà compressées par leur encodeur : elles sont stockées telles quelles
+    with zipfile.ZipFile(writer, "w", zipfile.ZIP_STORED) as archive:
+        async for status, data in results:
+            if data is not None:
+                archive.writestr(status["output"], data)
+            statuses.append(json.dumps(status) + "\n")
+            yield writer.take()
+        archive.writestr("status.ndjson", "".join(statuses))
+    yield writer.take()
+
+
+# Résultats d'un lot en NDJSON : une ligne JSON par image, avec l'image en base64
+# (base64_image) si le traitement a réussi
+async def ndjson_stream(results):
+    async for status, data in results:
+        if data is not None:
+            status["base64_image"] = data
+        yield (json.dumps(status) + "\n").encode()
+
+
+# Ligne de commande : appliquer une recette à une archive ZIP ou à un dossier d'images.
+# La sortie est une archive (.zip), un fichier NDJSON (.ndjson, "-" pour la sortie standard)
+# ou un dossier, auquel cas le statut de chaque image est écrit en NDJSON sur la sortie standard
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Appliquer une recette d'édition à un lot d'images")
+    parser.add_argument("input", help="archive ZIP ou dossier d'images")
+    parser.add_argument("output", help="archive .zip, fichier .ndjson, '-' ou dossier de sortie")
+    parser.add_argument("--edits", required=True, help="recette d'édition en JSON, ou chemin d'un fichier JSON")
+    parser.add_argument("--format", dest="output_format", help="format de sortie (png, jpeg, webp, gif)")
+    parser.add_argument("--quality", type=int, help="qualité JPEG/WebP (1-100)")
+    parser.add_argument("--compression", type=int, help="niveau de compression PNG (0-9)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="nombre de processus de travail")
+    parser.add_argument("--backend", choices=("process", "thread"), default="process", help="type de pool de travail")
+    return parser.parse_args(argv)
+
+
+def load_recipe(edits):
+    if os.path.isfile(edits):
+        with open(edits, encoding="utf-8") as f:
+            return f.read()
+    return edits
+
+
+async def write_output(results, output):
+    if output == "-" or output.endswith(".ndjson"):
+        with (open(output, "wb") if output != "-" else sys.stdout.buffer) as f:
+            async for chunk in ndjson_stream(results):
+                f.write(chunk)
+    elif output.endswith(".zip"):
+        with open(output, "wb") as f:
+            async for chunk in zip_stream(results):
+                f.write(chunk)
+    else:
+        root = Path(output)
+        async for status, data in results:
+            if data is not None:
+                path = root / status["output"]
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(data)
+            print(json.dumps(status), flush=True)
+
+
+async def run_cli(args, entries):
+    pool = WorkerPool(args.backend, args.workers, queue_size=args.workers)
+    try:
+        stages = EditPipeline(load_recipe(args.edits)).stages
+        ndjson = args.output == "-" or args.output.endswith(".ndjson")
+        results = run_batch(entries, stages, pool, concurrency=args.workers, output_format=args.output_format,
+                            quality=args.quality, compression=args.compression, as_base64=ndjson)
+        await write_output(results, args.output)
+    finally:
+        pool.shutdown()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if os.path.isdir(args.input):
+        asyncio.run(run_cli(args, iter_directory(args.input)))
+    else:
+        with zipfile.ZipFile(args.input) as archive:
+            asyncio.run(run_cli(args, iter_zip(archive)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import argparse
+import base64
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Les plus grandes images dépassent le délai par défaut des tâches du serveur
+os.environ.setdefault("WORKER_TIMEOUT", "600")
+
+import cv2
+import numpy as np
+import PIL
+import scipy
+from image_processor import Base64ImageProcessor
+
+
+# Banc d'essai du traitement d'image : chaque opération de Base64ImageProcessor, puis les endpoints
+# complets, sur des images synthétiques reproductibles (même graine, mêmes dimensions) de 0,3 à 50 Mpx
+# en L, RGB et RGBA. Les résultats peuvent être enregistrés en JSON et comparés à une référence
+# pour détecter les régressions de performance :
+#   python benchmark.py --output reference.json
+#   python benchmark.py --compare reference.json --tolerance 0.2
+
+DEFAULT_SIZES = (0.3, 1, 5, 12, 24, 50)
+DEFAULT_MODES = ("L", "RGB", "RGBA")
+
+# Recette utilisée pour les endpoints : opérations ponctuelles fusionnées puis un filtre de voisinage
+RECIPE = {
+    "contrast": {"enabled": True, "value": 70},
+    "luminance": {"enabled": True, "value": 60},
+    "median": {"enabled": True, "size": 5},
+}
+
+
+# Image synthétique au format 4:3 : ondulations différentes par canal (contours et dégradés)
+# et bruit gaussien (pour que l'encodage ne soit pas artificiellement facile)
+def synthetic_image(megapixels, mode, seed=0):
+    width = max(1, round(math.sqrt(megapixels * 1e6 * 4 / 3)))
+    height = max(1, round(megapixels * 1e6 / width))
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+
+    def channel(frequency, phase):
+        wave = 0.5 + 0.25 * np.sin(2 * np.pi * (frequency * x + phase)) + 0.25 * np.cos(2 * np.pi * frequency * y)
+        noise = rng.standard_normal((height, width), dtype=np.float32) * 8
+        return np.clip(wave * 255 + noise, 0, 255).astype(np.uint8)
+
+    if mode == "L":
+        return channel(7, 0)
+    channels = [channel(7, 0), channel(11, 0.3), channel(17, 0.6)]
+    if mode == "RGBA":
+        channels.append(np.broadcast_to((x * 255).astype(np.uint8), (height, width)))
+    return np.dstack(channels)
+
+
+def encode_png(array):
+    return Base64ImageProcessor.from_array(array, "PNG").encode("PNG")
+
+
+# Opérations du processeur : (préparation, opération mesurée). La préparation, non mesurée,
+# fournit à chaque répétition une entrée neuve (les éditions modifient le processeur)
+def processor_operations(array, png_bytes, base64_image):
+    def fresh():
+        return Base64ImageProcessor.from_array(array.copy(), "PNG")
+
+    return {
+        "decode_base64": (lambda: base64_image, Base64ImageProcessor),
+        "decode_bytes": (lambda: png_bytes, Base64ImageProcessor.from_bytes),
+        "contrast": (fresh, lambda p: p.contrast(70)),
+        "luminance": (fresh, lambda p: p.luminance(60)),
+        "grayscale": (fresh, lambda p: p.grayscale()),
+        "point_operations": (fresh, lambda p: p.point_operations(
+            [("contrast", {"value": 70}), ("luminance", {"value": 60}), ("grayscale", {})])),
+        "edges": (fresh, lambda p: p.edges(30, 100)),
+        "maximum": (fresh, lambda p: p.maximum(5)),
+        "minimum": (fresh, lambda p: p.minimum(5)),
+        "mean": (fresh, lambda p: p.mean(5)),
+        "median": (fresh, lambda p: p.median(5)),
+        "median_15": (fresh, lambda p: p.median(15)),
+        "histogram": (fresh, lambda p: p.calculate_histogram(statistics=True)),
+        "encode_png": (fresh, lambda p: p.encode("PNG")),
+        "encode_jpeg": (fresh, lambda p: p.encode("JPEG", quality=90)),
+        "encode_webp": (fresh, lambda p: p.encode("WEBP", quality=90)),
+        "get_base64_image": (fresh, lambda p: p.get_base64_image("PNG")),
+    }
+
+
+# Endpoints complets, appelés avec le client de test de FastAPI (sans réseau). Les endpoints qui
+# travaillent sur une image stockée partent d'un magasin vide : aucun résultat n'est déjà en cache
+def endpoint_operations(client, store, png_bytes, base64_image):
+    recipe = json.dumps(RECIPE)
+
+    def post(url, **kwargs):
+        response = client.post(url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def upload():
+        store.clear()
+        return post("/upload_file", files={"file": ("image.png", png_bytes, "image/png")}).json()["image_id"]
+
+    return {
+        "POST /upload_image": (store.clear, lambda _: post("/upload_image", data={"base64_image": base64_image})),
+        "POST /upload_file": (store.clear, lambda _: post(
+            "/upload_file", files={"file": ("image.png", png_bytes, "image/png")})),
+        "POST /edit_image": (lambda: None, lambda _: post(
+            "/edit_image", data={"base64_image": base64_image, "edits": recipe})),
+        "POST /edit_file": (lambda: None, lambda _: post(
+            "/edit_file", files={"file": ("image.png", png_bytes, "image/png")}, data={"edits": recipe})),
+        "POST /histogram/": (upload, lambda image_id: post(
+            "/histogram/", data={"image_id": image_id, "edits": recipe, "statistics": "true"})),
+        "POST /preview": (upload, lambda image_id: post("/preview", data={"image_id": image_id, "edits": recipe})),
+        "POST /export": (upload, lambda image_id: post("/export", data={"image_id": image_id, "edits": recipe})),
+    }
+
+
+# Durées (médiane, minimum) en secondes de `repeat` exécutions
+def measure(setup, func, repeat):
+    durations = []
+    for _ in range(repeat):
+        value = setup()
+        start = time.perf_counter()
+        func(value)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), min(durations)
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "pillow": PIL.__version__,
+        "scipy": scipy.__version__,
+    }
+
+
+def run(args):
+    client = store = None
+    if not args.no_endpoints:
+        from fastapi.testclient import TestClient
+        from image_store import store
+        from main import app
+        client = TestClient(app)
+
+    results = []
+    print(f"{'mode':<5} {'Mpx':>5} {'opération':<22} {'médiane (ms)':>13} {'min (ms)':>10} {'Mpx/s':>9}")
+    for megapixels in args.sizes:
+        for mode in args.modes:
+            array = synthetic_image(megapixels, mode)
+            height, width = array.shape[:2]
+            png_bytes = encode_png(array)
+            base64_image = f"data:image/png;base64,{base64.b64encode(png_bytes).decode()}"
+
+            operations = processor_operations(array, png_bytes, base64_image)
+            if client is not None:
+                operations.update(endpoint_operations(client, store, png_bytes, base64_image))
+
+            for name, (setup, func) in operations.items():
+                if args.operations and not any(pattern in name for pattern in args.operations):
+                    continue
+                try:
+                    median, fastest = measure(setup, func, args.repeat)
+                except Exception as e:
+                    # Une opération en échec (ex. image refusée par un endpoint) n'interrompt pas le banc
+                    error = str(e).splitlines()[0] if str(e) else type(e).__name__
+                    print(f"{mode:<5} {megapixels:>5} {name:<22} échec : {error}", flush=True)
+                    results.append({"mode": mode, "megapixels": megapixels, "operation": name, "error": error})
+                    continue
+                actual = width * height / 1e6
+                print(f"{mode:<5} {megapixels:>5} {name:<22} {median * 1000:>13.1f} {fastest * 1000:>10.1f} "
+                      f"{actual / median:>9.1f}", flush=True)
+                results.append({"mode": mode, "megapixels": megapixels, "width": width, "height": height,
+                                "operation": name, "median": median, "min": fastest})
+
+            if client is not None:
+                store.clear()
+    return results
+
+
+# Comparer les médianes à celles d'une référence ; renvoie la liste des régressions
+def compare(results, reference, tolerance, min_delta=0.002):
+    baseline = {(r["mode"], r["megapixels"], r["operation"]): r["median"]
+                for r in reference["results"] if "error" not in r}
+    regressions = []
+    for r in results:
+        if "error" in r:
+            continue
+        before = baseline.get((r["mode"], r["megapixels"], r["operation"]))
+        if before is not None and r["median"] > before * (1 + tolerance) and r["median"] - before > min_delta:
+            regressions.append((r, before))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai du traitement d'image")
+    parser.add_argument("--sizes", type=float, nargs="+", default=DEFAULT_SIZES, help="tailles en mégapixels")
+    parser.add_argument("--modes", nargs="+", choices=DEFAULT_MODES, default=DEFAULT_MODES)
+    parser.add_argument("--operations", nargs="+", help="ne mesurer que les opérations contenant l'un de ces noms")
+    parser.add_argument("--repeat", type=int, default=3, help="nombre d'exécutions par mesure (médiane)")
+    parser.add_argument("--no-endpoints", action="store_true", help="ne pas mesurer les endpoints")
+    parser.add_argument("--output", help="enregistrer les résultats dans ce fichier JSON")
+    parser.add_argument("--compare", help="fichier JSON de référence (produit avec --output)")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="ralentissement relatif toléré avant de signaler une régression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r, before in regressions:
+            print(f"RÉGRESSION {r['mode']} {r['megapixels']} Mpx {r['operation']} : "
+                  f"{before * 1000:.1f} ms -> {r['median'] * 1000:.1f} ms")
+        if regressions:
+            sys.exit(1)
+        print("Aucune régression")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from contextlib import contextmanager
+from contextvars import ContextVar
+import numpy as np
+from metrics import collect_timings, report
+
+
+# Réglages par défaut du pool de travail, configurables par variables d'environnement
+# "thread" : les opérations numpy/OpenCV/SciPy libèrent le GIL, un pool de threads suffit
+# "process" : pool de processus, les tableaux sont transmis par mémoire partagée
+WORKER_BACKEND = os.environ.get("WORKER_BACKEND", "thread")
+WORKER_COUNT = int(os.environ.get("WORKER_COUNT", os.cpu_count() or 1))
+# Nombre de tâches pouvant attendre un travailleur libre avant de refuser les requêtes (503)
+WORKER_QUEUE_SIZE = int(os.environ.get("WORKER_QUEUE_SIZE", 2 * WORKER_COUNT))
+# Durée maximale (en secondes) d'une requête, toutes tâches confondues, avant de répondre 504
+WORKER_TIMEOUT = float(os.environ.get("WORKER_TIMEOUT", 60))
+
+# Échéance (time.monotonic()) de la requête en cours, ou None si aucune n'a été fixée
+request_deadline = ContextVar("request_deadline", default=None)
+
+
+# Toutes les tâches en cours et en attente occupent déjà le pool
+class PoolSaturated(Exception):
+    pass
+
+
+# La tâche n'a pas terminé dans le délai imparti
+class JobTimeout(Exception):
+    pass
+
+
+# Tableau numpy transmis à un autre processus par mémoire partagée : seul son descripteur
+# (nom du segment, forme, type) est sérialisé, les pixels ne sont pas copiés par pickle
+class SharedArray:
+    def __init__(self, array):
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self.memory = SharedMemory(create=True, size=max(1, array.nbytes))
+        self.name = self.memory.name
+        self.view()[...] = array
+
+    def __getstate__(self):
+        return {"name": self.name, "shape": self.shape, "dtype": self.dtype}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.memory = None
+
+    # Tableau numpy directement adossé au segment de mémoire partagée
+    def view(self):
+        if self.memory is None:
+            self.memory = SharedMemory(name=self.name)
+        return np.ndarray(self.shape, np.dtype(self.dtype), buffer=self.memory.buf)
+
+    # Ne plus suivre dans ce processus un segment qu'il a créé : c'est le processus principal qui le
+    # supprimera (le suivi des ressources est commun au processus principal et aux processus de travail)
+    def untrack(self):
+        resource_tracker.unregister(self.memory._name, "shared_memory")
+
+    # Copier le tableau hors de la mémoire partagée puis libérer le segment
+    def collect(self):
+        array = self.view().copy()
+        self.release()
+        return array
+
+    def release(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+# Fixer l'échéance des tâches lancées dans le bloc : ensemble, elles disposent de `seconds` secondes
+# (une requête qui enchaîne décodage, éditions et encodage ne dispose pas d'un délai par tâche)
+@contextmanager
+def deadline(seconds=WORKER_TIMEOUT):
+    token = request_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+
+# Parcourir les SharedArray d'une valeur (éventuellement un tuple ou une liste)
+def iter_shared(value):
+    if isinstance(value, SharedArray):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        for v in value:
+            yield from iter_shared(v)
+
+
+# Remplacer les tableaux numpy d'une valeur par des SharedArray
+def share(value):
+    if isinstance(value, np.ndarray):
+        return SharedArray(value)
+    if isinstance(value, (tuple, list)):
+        return type(value)(share(v) for v in value)
+    return value
+
+
+# Opération inverse de share : dans le processus principal, les tableaux sont récupérés et leurs
+# segments libérés ; dans le processus de travail, ils sont lus sur place
+def unshare(value, collect=True):
+    if isinstance(value, SharedArray):
+        return value.collect() if collect else value.view()
+    if isinstance(value, (tuple, list)):
+        return type(value)(unshare(v, collect) for v in value)
+    return value
+
+
+# Libérer les segments de mémoire partagée d'une valeur qui ne sera pas lue
+def release(value):
+    for shared in iter_shared(value):
+        shared.release()
+
+
+# Exécuté dans le processus de travail : les tableaux reçus sont lus dans la mémoire partagée,
+# les tableaux renvoyés y sont copiés pour le processus principal
+def call_shared(func, args, kwargs):
+    result = share(func(*unshare(args, collect=False), **kwargs))
+    for shared in iter_shared(result):
+        shared.untrack()
+    return result
+
+
+# Libérer la mémoire partagée du résultat d'une tâche abandonnée
+def discard_result(future):
+    if not future.cancelled() and future.exception() is None:
+        release(future.result())
+
+
+# Pool de travail pour les opérations de calcul, afin de ne pas bloquer la boucle d'événements.
+# Le nombre de tâches en cours ou en attente est borné : au-delà, PoolSaturated est levée
+# immédiatement (le client doit réessayer plus tard) plutôt que de laisser la file grandir.
+class WorkerPool:
+    def __init__(self, backend=WORKER_BACKEND, workers=WORKER_COUNT, queue_size=WORKER_QUEUE_SIZE,
+                 timeout=WORKER_TIMEOUT):
+        if backend == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        elif backend == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+        else:
+            raise ValueError(f"Type de pool de travail inconnu : {backend}")
+        self.backend = backend
+        self.capacity = workers + queue_size
+        self.timeout = timeout
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def _acquire(self):
+        with self.lock:
+            if self.pending >= self.capacity:
+                raise PoolSaturated()
+            self.pending += 1
+
+    # La place n'est libérée que lorsque la tâche est vraiment terminée, même si le client a
+    # abandonné (délai dépassé) : une tâche déjà démarrée ne peut pas être interrompue
+    def _release(self, _):
+        with self.lock:
+            self.pending -= 1
+
+    def _submit(self, func, args, kwargs):
+        if self.backend == "thread":
+            return self.executor.submit(func, *args, **kwargs)
+
+        shared_args = share(args)
+        future = self.executor.submit(call_shared, func, shared_args, kwargs)
+        future.add_done_callback(lambda _: release(shared_args))
+        return future
+
+    # Exécuter func(*args, **kwargs) dans le pool et attendre son résultat. Les durées des étapes
+    # mesurées pendant la tâche (voir metrics.timed) sont rapportées à la requête en cours.
+    # Le délai est le temps restant avant l'échéance de la requête (voir deadline), ou à défaut
+    # celui du pool ; JobTimeout est levée sans lancer la tâche si l'échéance est déjà passée
+    async def run(self, func, *args, timeout=None, **kwargs):
+        timeout = timeout or self.timeout
+        end = request_deadline.get()
+        if end is not None:
+            timeout = min(timeout, end - time.monotonic())
+            if timeout <= 0:
+                raise JobTimeout()
+
+        self._acquire()
+        try:
+            future = self._submit(collect_timings, (func,) + args, kwargs)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # Annule la tâche si elle n'a pas encore démarré ; sinon son résultat sera ignoré
+            future.cancel()
+            if self.backend == "process":
+                future.add_done_callback(discard_result)
+            if isinstance(e, asyncio.TimeoutError):
+                raise JobTimeout()
+            raise
+
+        result, timings = unshare(result) if self.backend == "process" else result
+        report(timings)
+        return result
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+pool = WorkerPool()
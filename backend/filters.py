@@ -0,0 +1,70 @@
+import numpy as np
+import cv2
+
+
+# Filtres de voisinage (minimum, maximum, moyenne, médiane) sur une fenêtre carrée de côté size.
+# Chaque canal de couleur est filtré indépendamment (le canal alpha n'est jamais modifié) et les
+# bords sont traités par symétrie (dcba|abcd), comme le mode "reflect" de scipy.ndimage.
+# Pour les tailles paires, la fenêtre couvre size // 2 pixels avant le centre et (size - 1) // 2 après,
+# sauf pour la médiane (voir median_size).
+
+
+# Appliquer func aux canaux de couleur d'une image L, RGB ou RGBA
+def per_channel(array, func):
+    if array.ndim == 3 and array.shape[2] == 4:
+        out = array.copy()
+        out[:, :, :3] = func(np.ascontiguousarray(array[:, :, :3]))
+        return out
+    return func(array)
+
+
+def kernel(size):
+    return cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+
+
+# Minimum et maximum : érosion et dilatation d'OpenCV avec un élément structurant rectangulaire,
+# décomposées en passes horizontale et verticale. Aux bords, les pixels réfléchis sont déjà dans la
+# fenêtre : le résultat est identique à minimum_filter/maximum_filter de scipy, canal par canal.
+def minimum(array, size=3):
+    if size <= 1:
+        return array.copy()
+    return per_channel(array, lambda a: cv2.erode(a, kernel(size), borderType=cv2.BORDER_REFLECT))
+
+
+def maximum(array, size=3):
+    if size <= 1:
+        return array.copy()
+    return per_channel(array, lambda a: cv2.dilate(a, kernel(size), borderType=cv2.BORDER_REFLECT))
+
+
+# Moyenne : filtre boîte à sommes glissantes, en temps constant par pixel quelle que soit la taille.
+# L'arrondi est fait une seule fois sur la somme de la fenêtre (uniform_filter de scipy arrondit
+# après chaque passe, d'où des écarts d'une ou deux intensités)
+def mean(array, size=3):
+    if size <= 1:
+        return array.copy()
+    return per_channel(array, lambda a: cv2.blur(a, (size, size), borderType=cv2.BORDER_REFLECT))
+
+
+# Taille réellement utilisée par la médiane : une taille paire est arrondie à la taille impaire
+# supérieure. La fenêtre reste centrée sur le pixel et la médiane passe toujours par medianBlur,
+# qui n'accepte que les tailles impaires (une médiane paire canal par canal avec scipy prenait
+# plusieurs secondes, voire minutes, pour les grandes fenêtres)
+def median_size(size):
+    return size | 1
+
+
+# Médiane : medianBlur d'OpenCV (réseau de tri jusqu'à 5, puis médiane par histogrammes glissants
+# en temps constant par pixel). medianBlur réplique le bord : l'image est d'abord élargie par symétrie
+# pour garder le même résultat que median_filter de scipy (pour une taille impaire).
+def median(array, size=3):
+    if size <= 1:
+        return array.copy()
+    size = median_size(size)
+    r = size // 2
+
+    def blur(a):
+        padded = cv2.copyMakeBorder(a, r, r, r, r, cv2.BORDER_REFLECT)
+        return cv2.medianBlur(padded, size)[r:r + a.shape[0], r:r + a.shape[1]]
+
+    return per_channel(array, blur)
@@ -0,0 +1,82 @@
+import numpy as np
+from metrics import timed
+
+
+# Noms des canaux d'une image couleur, dans l'ordre du tableau numpy (RGB)
+CHANNEL_NAMES = ("red", "green", "blue")
+
+DEFAULT_PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+
+# Compter les occurrences des 256 intensités de chaque canal (le canal alpha est ignoré)
+# Le paramètre step permet de travailler sur une grille sous-échantillonnée (aperçus)
+def channel_counts(array, step=1):
+    if step < 1:
+        raise ValueError("Le pas d'échantillonnage doit être supérieur ou égal à 1")
+    if step > 1:
+        array = array[::step, ::step]
+
+    if array.ndim == 2:
+        return [np.bincount(array.ravel(), minlength=256)]
+    return [np.bincount(array[:, :, i].ravel(), minlength=256) for i in range(min(3, array.shape[2]))]
+
+
+# Statistiques d'un canal déduites directement de son histogramme, sans relire les pixels
+def channel_statistics(counts, percentiles=DEFAULT_PERCENTILES):
+    total = int(counts.sum())
+    if total == 0:
+        return {"min": None, "max": None, "mean": None, "percentiles": {}}
+
+    values = np.nonzero(counts)[0]
+    cumulative = np.cumsum(counts)
+    # Percentile : plus petite intensité dont l'effectif cumulé dépasse le rang recherché
+    ranks = np.asarray(percentiles, dtype=np.float64) / 100 * (total - 1)
+    positions = np.searchsorted(cumulative, ranks, side="right")
+
+    return {
+        "min": int(values[0]),
+        "max": int(values[-1]),
+        "mean": float(np.dot(np.arange(256), counts) / total),
+        "percentiles": {str(p): int(v) for p, v in zip(percentiles, positions)},
+    }
+
+
+# Regrouper un histogramme de 256 intensités en un nombre de classes plus réduit
+def rebin(counts, bins):
+    if bins == 256:
+        return counts
+    edges = (np.arange(bins) * 256) // bins
+    return np.add.reduceat(counts, edges)
+
+
+@timed("histogram")
+def compute_histogram(array, bins=256, cumulative=False, statistics=False,
+                      percentiles=DEFAULT_PERCENTILES, step=1):
+    """
+    Calcule en une seule passe l'histogramme d'une image L, RGB ou RGBA.
+    Le résultat a la même forme que celle attendue par le frontend :
+    "hist" pour une image en niveaux de gris, "hist_red/green/blue" pour une image en couleurs.
+    """
+    if not 1 <= bins <= 256:
+        raise ValueError("Le nombre de classes doit être compris entre 1 et 256")
+
+    counts = channel_counts(array, step)
+    if len(counts) == 1:
+        result = {"type": "bw"}
+        names = {"hist": counts[0]}
+    else:
+        result = {"type": "rgb"}
+        names = {f"hist_{name}": c for name, c in zip(CHANNEL_NAMES, counts)}
+    result["bins"] = bins
+
+    for key, channel in names.items():
+        binned = rebin(channel, bins)
+        result[key] = binned.tolist()
+        if cumulative:
+            result[key.replace("hist", "cumulative")] = np.cumsum(binned).tolist()
+
+    if statistics:
+        stats = {key.replace("hist_", ""): channel_statistics(channel, percentiles) for key, channel in names.items()}
+        result["stats"] = stats["hist"] if "hist" in stats else stats
+
+    return result
@@ -1,42 +1,135 @@
 import base64
+import logging
 import numpy as np
 from PIL import Image
 from io import BytesIO
 from PIL import Image, ImageEnhance
 import cv2
 import matplotlib.pyplot as plt
-from scipy.ndimage import maximum_filter, median_filter, minimum_filter, uniform_filter
+import filters
+from histogram import compute_histogram
+from tiling import TilingConfig
+from lut import PointProgram
+from metrics import timed
 
 
+logger = logging.getLogger(__name__)
+
+
+# Formats d'image pris en charge, indexés par type MIME
+IMAGE_FORMATS = {"image/png": "PNG", "image/jpeg": "JPEG", "image/gif": "GIF", "image/webp": "WEBP"}
+
+# Méthodes du processeur pouvant être utilisées comme étapes d'une recette d'édition
+EDIT_METHODS = ("contrast", "luminance", "grayscale", "edges", "maximum", "median", "minimum", "mean")
+
+
+# L'image envoyée n'est pas une data URL d'un format d'image pris en charge
+class UnsupportedImageFormat(ValueError):
+    pass
+
+
+# Obtenir le type MIME d'un format d'image Pillow ("PNG" -> "image/png")
+def get_mime_type(image_format):
+    for mime_type, supported_format in IMAGE_FORMATS.items():
+        if supported_format == image_format:
+            return mime_type
+    raise ValueError("Format d'image non pris en charge")
+
+
+# Normaliser le nom d'un format de sortie ("jpg" -> "JPEG") et vérifier qu'il est pris en charge
+def normalize_format(image_format):
+    image_format = image_format.upper()
+    if image_format == "JPG":
+        image_format = "JPEG"
+    get_mime_type(image_format)
+    return image_format
+
+
+# Réduire une image pour que son plus grand côté ne dépasse pas max_edge pixels.
+# Renvoie (image réduite, facteur d'échelle) ; l'image est renvoyée telle quelle si elle est déjà assez petite
+@timed("downscale")
+def downscale(array, max_edge):
+    height, width = array.shape[:2]
+    scale = max_edge / max(height, width)
+    if scale >= 1:
+        return array, 1.0
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(array, size, interpolation=cv2.INTER_AREA), scale
 
 
 # Classe qui permet de manipuler une image au format base64
+# L'image est décodée une seule fois dans un tableau numpy (self.array) sur lequel
+# travaillent toutes les méthodes d'édition ; elle n'est ré-encodée qu'à la demande.
 class Base64ImageProcessor:
+    # Réglages du traitement par tuiles des très grandes images (None pour le désactiver)
+    tiling = TilingConfig()
+
     # Initialisation avec une image en base64
     def __init__(self, base64_image):
         self.base64_image = base64_image
-        self.image, self.image_format = self.base64_to_image(base64_image)
+        image, self.image_format = self.base64_to_image(base64_image)
+        with timed("decode"):
+            self.array = self.image_to_array(image)
+
+    # Créer un processeur à partir d'un tableau numpy déjà décodé
+    @classmethod
+    def from_array(cls, array, image_format="PNG"):
+        processor = cls.__new__(cls)
+        processor.array = array
+        processor.image_format = image_format
+        processor.base64_image = None
+        return processor
+
+    # Créer un processeur à partir des octets bruts d'un fichier image (upload multipart)
+    @classmethod
+    def from_bytes(cls, image_bytes):
+        with timed("decode"):
+            image = Image.open(BytesIO(image_bytes))
+            if image.format not in IMAGE_FORMATS.values():
+                raise ValueError("Format d'image non pris en charge")
+            return cls.from_array(cls.image_to_array(image), image.format)
+
+    # L'image Pillow est reconstruite à la demande à partir du tableau numpy
+    @property
+    def image(self):
+        return Image.fromarray(self.array)
+
+    @image.setter
+    def image(self, image):
+        self.array = self.image_to_array(image)
 
     # Convertir une chaîne de base64 en objet image
     def base64_to_image(self, base64_str):
         # Extraire le header et la partie encodée de la chaîne base64
+        if ',' not in base64_str:
+            raise UnsupportedImageFormat("Format d'image non pris en charge")
         header, encoded = base64_str.split(',', 1)
-        
+
         # Déterminer le format de l'image à partir du header
-        if "image/png" in header:
-            image_format = "PNG"
-        elif "image/jpeg" in header:
-            image_format = "JPEG"
-        elif "image/gif" in header:
-            image_format = "GIF"
+        for mime_type, image_format in IMAGE_FORMATS.items():
+            if mime_type in header:
+                break
         else:
-            raise ValueError("Format d'image non pris en charge")
+            raise UnsupportedImageFormat("Format d'image non pris en charge")
 
         # Décoder les données base64 en octets et créer une image
-        image_bytes = base64.b64decode(encoded)
+        with timed("base64_decode"):
+            image_bytes = base64.b64decode(encoded)
         image = Image.open(BytesIO(image_bytes))
         return image, image_format
 
+    # Convertir une image Pillow en tableau numpy de mode L, RGB ou RGBA
+    @staticmethod
+    def image_to_array(image):
+        if image.mode not in ("L", "RGB", "RGBA"):
+            if image.mode in ("1", "I", "I;16", "F"):
+                image = image.convert("L")
+            elif "A" in image.getbands() or "transparency" in image.info:
+                image = image.convert("RGBA")
+            else:
+                image = image.convert("RGB")
+        return np.array(image)
+
     # Convertir un objet image en base64
     def image_to_base64(self, image):
         # Convertir l'image en octets avec le format correct
@@ -48,182 +141,145 @@ class Base64ImageProcessor:
         header = self.get_image_header()
         base64_str = f"{header},{base64_bytes.decode()}"
         return base64_str
-    
-    def get_base64_image(self):
-        self.base64_image = self.image_to_base64(self.image)
+
+    # Encoder l'image en octets. Le client peut choisir le format de sortie et régler l'encodeur :
+    # niveau de compression PNG (0-9, plus rapide vers 0) ou qualité JPEG/WebP (1-100)
+    @timed("encode")
+    def encode(self, image_format=None, quality=None, compression=None):
+        image_format = normalize_format(image_format or self.image_format)
+
+        options = {}
+        if image_format == "PNG" and compression is not None:
+            if not 0 <= compression <= 9:
+                raise ValueError("Le niveau de compression PNG doit être compris entre 0 et 9")
+            options["compress_level"] = compression
+        if image_format in ("JPEG", "WEBP") and quality is not None:
+            if not 1 <= quality <= 100:
+                raise ValueError("La qualité doit être comprise entre 1 et 100")
+            options["quality"] = quality
+
+        array = self.array
+        # Le JPEG ne supporte pas le canal alpha
+        if image_format == "JPEG" and array.ndim == 3 and array.shape[2] == 4:
+            array = array[:, :, :3]
+
+        buffered = BytesIO()
+        Image.fromarray(array).save(buffered, format=image_format, **options)
+        return buffered.getvalue()
+
+    def get_base64_image(self, image_format=None, quality=None, compression=None):
+        image_bytes = self.encode(image_format, quality, compression)
+        header = self.get_image_header(image_format)
+        with timed("base64_encode"):
+            self.base64_image = f"{header},{base64.b64encode(image_bytes).decode()}"
         return self.base64_image
 
     # Obtenir le header de l'image base64 pour conserver le format
-    def get_image_header(self):
-        # Extraire le header original de l'image base64
-        header = self.base64_image.split(',')[0]
-        return header 
-    
+    def get_image_header(self, image_format=None):
+        image_format = normalize_format(image_format or self.image_format)
+        return f"data:{get_mime_type(image_format)};base64"
+
+    # Appliquer une opération sur le tableau, d'un seul bloc ou tuile par tuile pour les très grandes
+    # images ; halo est le rayon du voisinage dont l'opération a besoin autour de chaque pixel
+    def process(self, func, halo=0):
+        if self.tiling is not None and self.tiling.applies(self.array):
+            self.array = self.tiling.run(self.array, func, halo)
+        else:
+            self.array = func(self.array)
+
     @staticmethod
     def clamp(value, min_value=0, max_value=255):
         # Ensure the clamping is done on an element-wise basis for numpy arrays
         return np.clip(value, min_value, max_value)  # Use np.clip to limit values between min and max
 
-    def contrast(self, value):
-
-        contrast_adjusted = (value / 100) * 510 - 255
-        # Convert the image to a numpy array
-        img_array = np.array(self.image).astype(np.float32)
+    # Appliquer une suite d'opérations ponctuelles (contrast, luminance, grayscale) compilée
+    # en tables de correspondance, en un seul parcours de l'image (voir lut.PointProgram)
+    # (durée mesurée sous le nom des opérations fusionnées, ex. "contrast+luminance")
+    def point_operations(self, stages):
+        with timed("+".join(method_name for method_name, _ in stages)):
+            self.process(PointProgram(stages).apply)
 
-        f = (259 * (contrast_adjusted + 255)) / (255 * (259 - contrast_adjusted))
-
-        for i in range(3):
-            img_array[:, :, i] = self.clamp(f * (img_array[:, :, i] - 128) + 128)
-
-        self.image = Image.fromarray(img_array.astype(np.uint8))
+    def contrast(self, value):
+        self.point_operations([("contrast", {"value": value})])
 
     def luminance(self, value):
         # Calculer l'ajustement de luminance
-        adjustment = value / 50
-        img_array = np.array(self.image)
-
-        for i in range(min(3, img_array.shape[2])):  # Ensure we don't exceed the channel bounds
-            img_array[:, :, i] = self.clamp(img_array[:, :, i] * adjustment)
-
-        # Convert back to PIL image
-        self.image = Image.fromarray(img_array.astype(np.uint8))
-        
+        self.point_operations([("luminance", {"value": value})])
 
     # Convertir une image en niveaux de gris
     def grayscale(self):
-        # Convertir l'image en tableau numpy
-        image_np = np.array(self.image)
-
         # Vérifier si l'image est déjà en niveaux de gris
-        if len(image_np.shape) == 2:
+        if len(self.array.shape) == 2:
             # Si elle est déjà en niveaux de gris, aucune conversion n'est nécessaire
-            print(image_np.shape)
-            return self.base64_image
-        
-        # Si elle est en RGB ou RGBA, convertir en niveaux de gris
-        # Formule commune pour la conversion en niveaux de gris :
-        # 0.2989 * R + 0.5870 * G + 0.1140 * B
-        if image_np.shape[2] == 4:
-            # Traiter RGBA en ignorant le canal alpha
-            image_np = image_np[:, :, :3]
-
-        # Calculer les valeurs en niveaux de gris
-        gray_np = (0.2989 * image_np[:, :, 0] + 0.5870 * image_np[:, :, 1] + 0.1140 * image_np[:, :, 2]).astype(np.uint8)
-
-        # Convertir le tableau numpy en image Pillow
-        grayscale_image = Image.fromarray(gray_np, mode="L")
-
-        self.image = grayscale_image
-            
-    def calculate_histogram(self):
+            return
+
+        # Si elle est en RGB ou RGBA (canal alpha ignoré), convertir en niveaux de gris
+        # (formule : voir lut.GRAYSCALE_WEIGHTS)
+        self.point_operations([("grayscale", {})])
+
+    def calculate_histogram(self, bins=256, cumulative=False, statistics=False, step=1):
         """
-        Une image BGR est représentée par une matrice de taille (hauteur, largeur, 3), 
-        où 3 représente les canaux de couleur (bleu, vert, rouge)
+        Une image couleur est représentée par une matrice de taille (hauteur, largeur, 3 ou 4),
+        où les canaux sont dans l'ordre rouge, vert, bleu (et alpha, ignoré ici).
+        Le calcul est vectorisé (voir histogram.compute_histogram).
         """
-        image = np.array(self.image)
-
-        if image is None:
-            print("Impossible de lire l'image.")
-
-        print(image.shape) # (609, 608) for BW
-        print(len(image.shape)) # 2 for BW 3 FOR NORMAL
-        if (len(image.shape)==3): # IMAGE EN COULEURS
-            # Séparer les canaux de couleur:
-            blue_channel = image[:,:,0]
-            green_channel = image[:,:,1]
-            red_channel = image[:,:,2]
-            
-            # Initialiser l'histogramme pour chaque couleur
-            hist_blue = np.zeros(256)
-            hist_green = np.zeros(256)
-            hist_red = np.zeros(256)
-            
-            # Compter les occurrences de chaque intensité de lumière d'un pixel dans chaque canal
-            for i in range(image.shape[0]):
-                for j in range(image.shape[1]):
-                    hist_blue[blue_channel[i,j]] += 1
-                    hist_green[green_channel[i,j]] += 1
-                    hist_red[red_channel[i,j]] += 1
-
-            return hist_blue, hist_green, hist_red
-        else: # IMAGE EN NOIR ET BLANC
-
-            # Initialiser l'histogramme
-            histogram = np.zeros(256)
-
-            # Calculer le nombre d'occurence de chaque valeur de pixel
-            for pixel_value in image.flatten():
-                histogram[pixel_value] += 1
-
-            return histogram
+        return compute_histogram(self.array, bins=bins, cumulative=cumulative, statistics=statistics, step=step)
 
 
+    @timed("edges")
     def edges(self, threshold1 = 30, threshold2 = 100):
         """
         Pour détecter les contours dans une image, nous devons d'abord la convertir en niveaux de gris
 
-        Puis il y aura un calcul de gradient: Les contours sont souvent définis comme des changements significatifs 
-        dans les niveaux d'intensité de l'image. 
+        Puis il y aura un calcul de gradient: Les contours sont souvent définis comme des changements significatifs
+        dans les niveaux d'intensité de l'image.
         Pour détecter ces changements, la détection de contour utilise généralement des opérateurs de gradient,
-        tels le filtre de Laplace (filtres passe-haut). 
+        tels le filtre de Laplace (filtres passe-haut).
 
         Ensuite, nous devons appliquer un seuillage pour convertir l'image en bitmap
         où les pixels sont soit considérés comme appartenant à un contour, soit non. On doit donc specifier les seuils (thresholds)
         """
 
-        print("Threshold1:", threshold1)
-        print("Threshold2:", threshold2)
-
-        image = np.array(self.image)
+        logger.debug("Seuils de Canny : %s, %s", threshold1, threshold2)
 
         # Convertir l'image en niveaux de gris s'il ne l'est pas déjà
-        try:
-            gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        except:
-            gray_image=image
-            print("img already in grayscale")
-        # Appliquer l'opérateur de détection de contours Canny
-        edges = cv2.Canny(gray_image, threshold1=threshold1, threshold2=threshold2)
-
+        if self.array.ndim == 3:
+            code = cv2.COLOR_BGRA2GRAY if self.array.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+            self.process(lambda image: cv2.cvtColor(image, code))
+        else:
+            logger.debug("Image déjà en niveaux de gris")
+        gray_image = self.array
 
-        # Convertir le tableau numpy en image Pillow
-        edges_image = Image.fromarray(edges)
+        # Appliquer l'opérateur de détection de contours Canny
+        if self.tiling is not None and self.tiling.applies(gray_image):
+            edges = self.tiling.canny(gray_image, threshold1, threshold2)
+        else:
+            edges = cv2.Canny(gray_image, threshold1=threshold1, threshold2=threshold2)
 
-        self.image = edges_image
+        self.array = edges
 
         return edges
-    
+
        # Appliquer un filtre maximum
+    @timed("maximum")
     def maximum(self, size=3):
-        image_np = np.array(self.image)
-        gray_np = maximum_filter(image_np, size=size)
-        filtered_image = Image.fromarray(gray_np)
-        self.image = filtered_image
+        self.process(lambda image: filters.maximum(image, size), halo=size // 2)
 
-    # Appliquer un filtre médian
+    # Appliquer un filtre médian (chaque canal de couleur est filtré séparément)
+    @timed("median")
     def median(self, size=3):
-        # Le filtre median necessite une image noir et blanc
-        self.grayscale()
-        image_np = np.array(self.image)
-        gray_np = median_filter(image_np, size=size)
-        filtered_image = Image.fromarray(gray_np)
-        self.image = filtered_image
+        self.process(lambda image: filters.median(image, size), halo=size // 2)
 
     # Appliquer un filtre minimum
+    @timed("minimum")
     def minimum(self, size=3):
-        image_np = np.array(self.image)
-        gray_np = minimum_filter(image_np, size=size)
-        filtered_image = Image.fromarray(gray_np)
-        self.image = filtered_image
+        self.process(lambda image: filters.minimum(image, size), halo=size // 2)
 
     # Appliquer un filtre moyen (uniforme)
+    @timed("mean")
     def mean(self, size=3):
-        image_np = np.array(self.image)
-        gray_np = uniform_filter(image_np, size=size)
-        filtered_image = Image.fromarray(gray_np)
-        self.image = filtered_image
-        
-    
+        self.process(lambda image: filters.mean(image, size), halo=size // 2)
+
 
 # Test de la classe
 if __name__ == "__main__":
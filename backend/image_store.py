@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+# Budget mémoire par défaut du magasin d'images (en Mo), configurable par variable d'environnement
+DEFAULT_MAX_MB = int(os.environ.get("IMAGE_STORE_MAX_MB", 512))
+
+# Part maximale du budget que peut occuper un seul résultat intermédiaire : au-delà, il n'est pas gardé
+MAX_RESULT_FRACTION = 0.25
+
+
+# L'image ne tient pas dans le budget du magasin, même en évinçant toutes les autres
+class ImageTooLarge(ValueError):
+    pass
+
+
+# Clé d'un résultat intermédiaire : identifiant de l'image + préfixe de la recette d'édition
+def prefix_key(image_id, stages):
+    return (image_id, json.dumps(stages, sort_keys=True))
+
+
+# Identifiant de l'image envoyée par le client dont dérive une entrée (résultat ou proxy "id@taille")
+def source_of(key):
+    image_id = key[0] if isinstance(key, tuple) else key
+    return image_id.split("@", 1)[0]
+
+
+# Magasin d'images en mémoire, adressé par contenu, avec éviction LRU et budget en octets.
+# Il contient les images décodées (tableaux numpy) et leurs proxys, ainsi que les résultats
+# intermédiaires de la chaîne d'éditions, pour ne recalculer que les étapes qui ont changé.
+# Les résultats, qui peuvent toujours être recalculés, sont évincés avant les images : un résultat
+# ne fait jamais de place en évinçant une image, et une image n'évince jamais celle dont elle dérive.
+class ImageStore:
+    def __init__(self, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        # Images envoyées par les clients et leurs proxys
+        self.images = OrderedDict()
+        # Résultats intermédiaires des recettes
+        self.results = OrderedDict()
+        self.image_bytes = 0
+        self.result_bytes = 0
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.image_bytes + self.result_bytes
+
+    # Identifiant d'une image : empreinte de ses pixels, de sa forme et de son format
+    @staticmethod
+    def image_hash(array, image_format):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{array.shape}{array.dtype}{image_format}".encode())
+        digest.update(memoryview(array).cast("B") if array.flags.c_contiguous else array.tobytes())
+        return digest.hexdigest()
+
+    # Évincer les résultats les moins récemment utilisés jusqu'à pouvoir ajouter nbytes octets
+    def _evict_results(self, nbytes):
+        while self.results and self.nbytes + nbytes > self.max_bytes:
+            _, (_, evicted) = self.results.popitem(last=False)
+            self.result_bytes -= evicted
+
+    # Retirer une image ainsi que ses proxys et tous les résultats qui en dérivent
+    def _drop_image(self, image_id):
+        for key in [key for key in self.results if source_of(key) == image_id]:
+            self.result_bytes -= self.results.pop(key)[1]
+        for key in [key for key in self.images if source_of(key) == image_id]:
+            self.image_bytes -= self.images.pop(key)[1]
+
+    def _insert_image(self, key, value, nbytes):
+        if key in self.images:
+            self.images.move_to_end(key)
+            return
+        if nbytes > self.max_bytes:
+            raise ImageTooLarge("L'image est trop volumineuse pour le magasin d'images")
+
+        self._evict_results(nbytes)
+        # Puis les images les moins récemment utilisées, sauf celle dont la nouvelle entrée dérive
+        source = source_of(key)
+        while self.nbytes + nbytes > self.max_bytes:
+            evicted = next((k for k in self.images if source_of(k) != source), None)
+            if evicted is None:
+                break
+            self._drop_image(source_of(evicted))
+        self.images[key] = (value, nbytes)
+        self.image_bytes += nbytes
+
+    def _insert_result(self, key, value, nbytes):
+        if key in self.results:
+            self.results.move_to_end(key)
+            return
+        if nbytes > self.max_bytes * MAX_RESULT_FRACTION:
+            return
+        self._evict_results(nbytes)
+        # Les images occupent tout le budget : le résultat n'est pas gardé
+        if self.nbytes + nbytes > self.max_bytes:
+            return
+        self.results[key] = (value, nbytes)
+        self.result_bytes += nbytes
+
+    def _lookup(self, entries, key):
+        value, _ = entries[key]
+        entries.move_to_end(key)
+        return value
+
+    # Les tableaux stockés sont partagés entre les requêtes : on les rend non modifiables
+    @staticmethod
+    def _freeze(array):
+        array.setflags(write=False)
+        return array
+
+    # Stocker une image décodée et renvoyer son identifiant (qui peut être calculé à l'avance).
+    # Lève ImageTooLarge si l'image dépasse à elle seule le budget du magasin
+    def put(self, array, image_format, image_id=None):
+        image_id = image_id or self.image_hash(array, image_format)
+        with self.lock:
+            self._insert_image(image_id, (self._freeze(array), image_format), array.nbytes)
+        return image_id
+
+    # Récupérer (tableau, format) ; lève KeyError si l'image est inconnue ou a été évincée
+    def get(self, image_id):
+        with self.lock:
+            return self._lookup(self.images, image_id)
+
+    # Vider le magasin (images, proxys et résultats intermédiaires)
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.results.clear()
+            self.image_bytes = self.result_bytes = 0
+
+    def __contains__(self, image_id):
+        with self.lock:
+            return image_id in self.images
+
+    # Stocker le résultat de l'application des étapes `stages` sur l'image
+    def put_result(self, image_id, stages, array):
+        with self.lock:
+            self._insert_result(prefix_key(image_id, stages), self._freeze(array), array.nbytes)
+
+    # Trouver le plus long préfixe de la recette déjà calculé.
+    # Renvoie (nombre d'étapes déjà appliquées, tableau correspondant)
+    def longest_prefix(self, image_id, stages):
+        with self.lock:
+            for n in range(len(stages), 0, -1):
+                key = prefix_key(image_id, stages[:n])
+                if key in self.results:
+                    return n, self._lookup(self.results, key)
+            return 0, self._lookup(self.images, image_id)[0]
+
+    # Identifiant et facteur d'échelle de la version réduite (proxy) d'une image utilisée pour les
+    # aperçus ; si l'image est déjà assez petite, c'est l'image elle-même (échelle 1)
+    def proxy_info(self, image_id, max_edge):
+        array, _ = self.get(image_id)
+        scale = max_edge / max(array.shape[:2])
+        if scale >= 1:
+            return image_id, 1.0
+        return f"{image_id}@{max_edge}", scale
+
+    # Stocker un proxy, créé une seule fois puis conservé comme une image à part entière
+    # (il n'évince jamais l'image dont il est issu)
+    def put_proxy(self, proxy_id, proxy, image_format):
+        with self.lock:
+            self._insert_image(proxy_id, (self._freeze(proxy), image_format), proxy.nbytes)
+
+
+store = ImageStore()
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+from executor import JobTimeout, PoolSaturated, deadline
+from histogram import compute_histogram
+from image_processor import normalize_format
+from image_store import prefix_key
+from pipeline import DEFAULT_PREVIEW_EDGE, EditPipeline, encode_array, group_stages, load_proxy, run_stages, scale_stages
+
+
+logger = logging.getLogger(__name__)
+
+# Délai (en secondes) avant de relancer un rendu quand le pool de travail est saturé
+RETRY_DELAY = 0.05
+
+
+# Appliquer une modification (delta) à une recette d'édition : pour chaque méthode, les arguments
+# envoyés remplacent les précédents (ex. {"median": {"size": 5}} ne change que la taille) ;
+# null retire la méthode de la recette
+def merge_edits(recipe, delta):
+    if not isinstance(delta, dict):
+        raise ValueError("Les éditions doivent être un objet JSON")
+    recipe = dict(recipe)
+    for method_name, args in delta.items():
+        if args is None:
+            recipe.pop(method_name, None)
+        elif isinstance(args, dict):
+            recipe[method_name] = {**recipe.get(method_name, {}), **args}
+        else:
+            raise ValueError(f"Arguments invalides pour {method_name}")
+    return recipe
+
+
+# Fonction de calcul exécutée par le pool de travail : image encodée en base64 et, si demandé,
+# son histogramme, calculés sur le même tableau
+def render_frame(array, image_format, histogram=True, output_format=None, quality=None, compression=None):
+    base64_image = encode_array(array, image_format, output_format, quality, compression, as_base64=True)
+    return base64_image, compute_histogram(array) if histogram else None
+
+
+# Session d'édition en direct sur WebSocket.
+#
+# Le client ouvre la session sur une image du magasin :
+#   {"type": "open", "image_id": ..., "edits": {...}, "max_edge": 1024, "histogram": true,
+#    "image_format": ..., "quality": ..., "compression": ..., "seq": 0}
+# puis n'envoie que les modifications de la recette (voir merge_edits) :
+#   {"type": "edit", "edits": {"contrast": {"value": 70}}, "seq": 1}
+# Le serveur répond par {"type": "frame", "seq": ..., "base64_image": ..., "histogram": ..., "width": ...,
+# "height": ...}, seq étant celui du dernier message pris en compte, ou par {"type": "error", "status": ...,
+# "detail": ...} (404 : l'image n'est plus dans le magasin et doit être renvoyée).
+#
+# La session garde l'aperçu réduit de l'image et les résultats intermédiaires de son dernier rendu.
+# Une seule image est rendue à la fois, toujours pour la dernière version de la recette : les versions
+# reçues pendant un rendu sont fusionnées et seule la plus récente est rendue ensuite. Un rendu devenu
+# obsolète est abandonné à la fin de l'étape en cours (un calcul déjà démarré ne peut pas être
+# interrompu) et son image n'est ni encodée ni envoyée ; les étapes déjà terminées restent utilisables
+# par le rendu suivant si elles forment un préfixe de la nouvelle recette.
+class LiveSession:
+    def __init__(self, websocket, store, pool):
+        self.websocket = websocket
+        self.store = store
+        self.pool = pool
+        self.image_id = None
+        self.array = None
+        self.image_format = None
+        self.scale = 1.0
+        self.histogram = True
+        self.options = {}
+        self.recipe = {}
+        self.seq = None
+        # Résultats intermédiaires du dernier rendu, indexés par préfixe de la recette
+        self.cache = {}
+        # Version de la recette, incrémentée à chaque message : un rendu dont la version n'est plus
+        # la version courante est obsolète
+        self.version = 0
+        self.changed = asyncio.Event()
+
+    # Recevoir les messages jusqu'à la déconnexion du client (WebSocketDisconnect)
+    async def run(self):
+        renderer = asyncio.ensure_future(self.render_loop())
+        try:
+            while True:
+                await self.handle(await self.websocket.receive_text())
+        finally:
+            renderer.cancel()
+
+    async def handle(self, text):
+        try:
+            message = json.loads(text)
+            if not isinstance(message, dict):
+                raise ValueError("Le message doit être un objet JSON")
+            if message.get("type") == "open":
+                await self.open(message)
+            elif message.get("type") == "edit":
+                self.edit(message)
+            else:
+                raise ValueError("Type de message inconnu")
+        except KeyError:
+            await self.send_error(404, "Image inconnue ou expirée, veuillez la renvoyer")
+        except ValueError as e:
+            await self.send_error(400, str(e))
+        except (TypeError, AttributeError):
+            # Champ du message d'un type inattendu : la session reste ouverte pour les messages suivants
+            await self.send_error(400, "Message invalide")
+        except PoolSaturated:
+            await self.send_error(503, "Serveur occupé, veuillez réessayer")
+        except JobTimeout:
+            await self.send_error(504, "Le traitement de l'image a pris trop de temps")
+
+    # Ouvrir (ou rouvrir) la session sur une image du magasin
+    async def open(self, message):
+        if not isinstance(message.get("image_id"), str):
+            raise ValueError("image_id est requis")
+        max_edge = message.get("max_edge", DEFAULT_PREVIEW_EDGE)
+        if isinstance(max_edge, bool) or not isinstance(max_edge, int) or max_edge < 1:
+            raise ValueError("max_edge doit être un entier supérieur ou égal à 1")
+        output_format = message.get("image_format")
+        if output_format is not None and not isinstance(output_format, str):
+            raise ValueError("image_format doit être une chaîne de caractères")
+        recipe = merge_edits({}, message.get("edits") or {})
+
+        proxy_id, scale = await load_proxy(self.store, message["image_id"], self.pool, max_edge)
+        self.array, self.image_format = self.store.get(proxy_id)
+        self.image_id, self.scale = proxy_id, scale
+        self.histogram = bool(message.get("histogram", True))
+        self.options = {"output_format": normalize_format(output_format) if output_format else None,
+                        "quality": message.get("quality"), "compression": message.get("compression")}
+        self.recipe = recipe
+        self.cache = {}
+        self.update(message)
+
+    def edit(self, message):
+        if self.array is None:
+            raise ValueError("La session n'est pas ouverte")
+        self.recipe = merge_edits(self.recipe, message.get("edits") or {})
+        self.update(message)
+
+    def update(self, message):
+        self.seq = message.get("seq")
+        self.version += 1
+        self.changed.set()
+
+    def stale(self, version):
+        return version != self.version
+
+    async def send_error(self, status, detail):
+        await self.websocket.send_json({"type": "error", "status": status, "detail": detail})
+
+    # Rendre la dernière version de la recette chaque fois qu'elle change
+    async def render_loop(self):
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            version, seq = self.version, self.seq
+            try:
+                # Toutes les tâches d'un rendu partagent la même échéance
+                with deadline(self.pool.timeout):
+                    frame = await self.render(version)
+            except PoolSaturated:
+                # Réessayer un peu plus tard, avec la version de la recette la plus récente
+                await asyncio.sleep(RETRY_DELAY)
+                self.changed.set()
+                continue
+            except JobTimeout:
+                await self.send_error(504, "Le traitement de l'image a pris trop de temps")
+                continue
+            except ValueError as e:
+                # Paramètres d'édition invalides : la session reste ouverte pour les messages suivants
+                await self.send_error(400, f"Paramètres d'édition invalides : {e}")
+                continue
+            except TypeError:
+                # Paramètre d'un type inattendu (ex. une taille envoyée comme texte)
+                await self.send_error(400, "Paramètres d'édition invalides")
+                continue
+            except Exception:
+                logger.exception("Échec du rendu de la session d'édition en direct")
+                await self.send_error(500, "Erreur interne lors du rendu de l'aperçu")
+                continue
+            if frame is not None:
+                await self.websocket.send_json({"type": "frame", "seq": seq, **frame})
+
+    # Rendre la recette étape par étape ; renvoie None si le rendu est devenu obsolète
+    async def render(self, version):
+        stages = scale_stages(EditPipeline(self.recipe).stages, self.scale)
+
+        # Ne garder que les résultats qui sont des préfixes de la recette et repartir du plus long
+        keys = [prefix_key(self.image_id, stages[:n]) for n in range(1, len(stages) + 1)]
+        self.cache = {key: self.cache[key] for key in keys if key in self.cache}
+        done, array = 0, self.array
+        for n, key in enumerate(keys, 1):
+            if key in self.cache:
+                done, array = n, self.cache[key]
+
+        for group in group_stages(stages[done:]):
+            if self.stale(version):
+                return None
+            array = (await self.pool.run(run_stages, array, self.image_format, group))[-1]
+            done += len(group)
+            self.cache[keys[done - 1]] = array
+
+        if self.stale(version):
+            return None
+        base64_image, histogram = await self.pool.run(render_frame, array, self.image_format, self.histogram,
+                                                      **self.options)
+        # Une nouvelle version est arrivée pendant l'encodage : cette image ne sera jamais affichée
+        if self.stale(version):
+            return None
+
+        height, width = array.shape[:2]
+        return {"base64_image": base64_image, "histogram": histogram, "width": width, "height": height}
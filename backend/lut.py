@@ -0,0 +1,86 @@
+import numpy as np
+import cv2
+
+
+# Opérations ponctuelles : la nouvelle valeur d'un pixel ne dépend que de son ancienne valeur
+# (et, pour la conversion en niveaux de gris, des autres canaux du même pixel)
+POINT_OPERATIONS = ("contrast", "luminance", "grayscale")
+
+# Formule commune pour la conversion en niveaux de gris : 0.2989 * R + 0.5870 * G + 0.1140 * B
+GRAYSCALE_WEIGHTS = (0.2989, 0.5870, 0.1140)
+
+# Les mêmes poids en virgule fixe : dix-millièmes, puis 16 bits de partie fractionnaire.
+# Une somme pondérée tient sur 24 bits (int32, et sans perte en float32)
+GRAYSCALE_WEIGHTS_10000 = tuple(round(weight * 10000) for weight in GRAYSCALE_WEIGHTS)
+GRAYSCALE_SHIFT = 16
+
+IDENTITY = np.arange(256, dtype=np.uint8)
+
+
+# Table de correspondance du contraste : même calcul en float32 que l'ancien traitement pixel par pixel,
+# mais fait une seule fois pour chacune des 256 intensités possibles
+def contrast_lut(value):
+    contrast_adjusted = (value / 100) * 510 - 255
+    f = (259 * (contrast_adjusted + 255)) / (255 * (259 - contrast_adjusted))
+    values = IDENTITY.astype(np.float32)
+    return np.clip(f * (values - 128) + 128, 0, 255).astype(np.uint8)
+
+
+# Table de correspondance de la luminance
+def luminance_lut(value):
+    adjustment = value / 50
+    return np.clip(IDENTITY * adjustment, 0, 255).astype(np.uint8)
+
+
+POINT_LUTS = {"contrast": contrast_lut, "luminance": luminance_lut}
+
+
+# Tables (int32) de la conversion en niveaux de gris, une par canal, appliquées après color_lut :
+# weight * color_lut[v] en virgule fixe, arrondi par excès. L'erreur d'arrondi (moins de 3 / 2**16)
+# reste sous l'écart minimal de 1 / 10000 entre une somme pondérée et l'entier suivant : le décalage
+# donne exactement la partie entière de 0.2989 * R + 0.5870 * G + 0.1140 * B
+def grayscale_table(color_lut):
+    values = color_lut.astype(np.int64) << GRAYSCALE_SHIFT
+    tables = [-(-weight * values // 10000) for weight in GRAYSCALE_WEIGHTS_10000]
+    return np.stack(tables, axis=-1).astype(np.int32).reshape(1, 256, 3)
+
+
+# Suite d'opérations ponctuelles consécutives compilée en tables de correspondance de 256 entrées.
+# Les tables successives se composent (table2[table1]) : quel que soit le nombre d'opérations,
+# l'image n'est parcourue qu'une fois, en uint8. Une conversion en niveaux de gris sépare la table
+# appliquée aux canaux de couleur (avant) de celle appliquée au canal gris (après).
+class PointProgram:
+    def __init__(self, stages=()):
+        self.color_lut = IDENTITY
+        self.grayscale = False
+        self.gray_lut = IDENTITY
+        for method_name, kwargs in stages:
+            self.add(method_name, kwargs)
+
+    def add(self, method_name, kwargs):
+        if method_name == "grayscale":
+            self.grayscale = True
+        elif self.grayscale:
+            self.gray_lut = POINT_LUTS[method_name](**kwargs)[self.gray_lut]
+        else:
+            self.color_lut = POINT_LUTS[method_name](**kwargs)[self.color_lut]
+        return self
+
+    # Appliquer le programme à une image L, RGB ou RGBA (le canal alpha n'est jamais modifié)
+    def apply(self, array):
+        if array.ndim == 2:
+            return cv2.LUT(array, self.gray_lut[self.color_lut])
+
+        if self.grayscale:
+            # Le canal alpha est ignoré ; chaque canal passe par sa table pondérée en virgule fixe,
+            # puis les canaux sont sommés en int32 : pas de tableau float64 intermédiaire
+            if array.shape[2] == 4:
+                array = cv2.cvtColor(array, cv2.COLOR_RGBA2RGB)
+            weighted = cv2.transform(cv2.LUT(array, grayscale_table(self.color_lut)), np.ones((1, 3), np.float32))
+            gray = np.right_shift(weighted, GRAYSCALE_SHIFT, out=weighted).astype(np.uint8)
+            return cv2.LUT(gray, self.gray_lut)
+
+        if array.shape[2] == 4:
+            table = np.stack([self.color_lut] * 3 + [IDENTITY], axis=-1).reshape(1, 256, 4)
+            return cv2.LUT(array, table)
+        return cv2.LUT(array, self.color_lut)
@@ -1,11 +1,24 @@
 from http.client import HTTPException
+from contextlib import asynccontextmanager
 from io import BytesIO
-import json
+import asyncio
+import binascii
+import shutil
+import tempfile
+import time
+import zipfile
 from typing import Union
-from image_processor import Base64ImageProcessor
-from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Query
+from image_processor import Base64ImageProcessor, UnsupportedImageFormat, get_mime_type, normalize_format
+from pipeline import EditPipeline, DEFAULT_PREVIEW_EDGE, decode_base64, decode_bytes, encode_array, run_stages
+from histogram import compute_histogram
+from image_store import ImageTooLarge, store
+from executor import deadline, pool, PoolSaturated, JobTimeout
+from metrics import REQUEST_DURATION, collect, render_metrics, server_timing
+from live import LiveSession
+from batch import BATCH_OUTPUTS, iter_zip, ndjson_stream, run_batch, zip_stream
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from PIL import Image, ImageEnhance, ImageTk
 import numpy as np
 import cv2
@@ -13,52 +26,290 @@ import base64
 
 
 
-app = FastAPI()
+# Le pool de travail est arrêté avec le serveur
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    pool.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173"],  # Specify your frontend origin
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 
+# Mesurer la durée de chaque requête et de ses étapes de traitement (décodage, éditions, encodage,
+# histogramme) : elles sont renvoyées dans l'en-tête Server-Timing et agrégées dans /metrics.
+# L'échéance de la requête (WORKER_TIMEOUT) est fixée ici et partagée par toutes ses tâches
+@app.middleware("http")
+async def timing_middleware(request, call_next):
+    start = time.perf_counter()
+    with collect() as timings, deadline(pool.timeout):
+        response = await call_next(request)
+    total = time.perf_counter() - start
+
+    # Les requêtes sont regroupées par route (et non par chemin demandé, qui peut être quelconque)
+    route = request.scope.get("route")
+    REQUEST_DURATION.observe(route.path if route is not None else "other", total)
+    response.headers["Server-Timing"] = server_timing(timings, total)
+    return response
+
+
+# Pool de travail saturé : le client doit réessayer un peu plus tard
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request, exc):
+    return JSONResponse(status_code=503, headers={"Retry-After": "1"},
+                        content={"detail": "Serveur occupé, veuillez réessayer"})
+
+
+@app.exception_handler(JobTimeout)
+async def job_timeout_handler(request, exc):
+    return JSONResponse(status_code=504, content={"detail": "Le traitement de l'image a pris trop de temps"})
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
 
+
+# Métriques au format Prometheus : histogrammes de latence des étapes de traitement et des requêtes
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# Analyser la recette d'édition envoyée par le client ; une recette invalide donne une erreur 400
+def parse_pipeline(edits):
+    try:
+        return EditPipeline(edits or "{}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Recette d'édition invalide : {e}")
+
+
+# Obtenir le processeur de l'image demandée : image du magasin (avec sa recette d'édition,
+# en aperçu réduit si max_edge est donné) ou image envoyée directement en base64
+async def load_processor(base64_image, image_id, edits=None, max_edge=None):
+    if max_edge is not None and max_edge < 1:
+        raise HTTPException(status_code=400, detail="max_edge doit être supérieur ou égal à 1")
+    pipeline = parse_pipeline(edits)
+    if image_id is not None:
+        try:
+            if max_edge is not None:
+                return await pipeline.preview(store, image_id, pool, max_edge)
+            return await pipeline.render(store, image_id, pool)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Image inconnue ou expirée, veuillez la renvoyer")
+    if base64_image is None:
+        raise HTTPException(status_code=422, detail="base64_image ou image_id est requis")
+
+    processor = await decode_payload(base64_image)
+    outputs = await pool.run(run_stages, processor.array, processor.image_format, pipeline.stages)
+    if outputs:
+        processor.array = outputs[-1]
+    return processor
+
+
+# Décoder une image envoyée en base64 (data URL) : un base64 invalide donne une erreur 400,
+# un format absent, non pris en charge ou illisible une erreur 415
+async def decode_payload(base64_image):
+    try:
+        array, image_format = await pool.run(decode_base64, base64_image)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="Données base64 invalides")
+    except (ValueError, OSError):
+        raise HTTPException(status_code=415, detail="Format d'image non pris en charge")
+    return Base64ImageProcessor.from_array(array, image_format)
+
+
+# Décoder un fichier image envoyé en multipart
+async def decode_upload(image_bytes):
+    try:
+        array, image_format = await pool.run(decode_bytes, image_bytes)
+    except (ValueError, OSError):
+        raise HTTPException(status_code=415, detail="Format d'image non pris en charge")
+    return Base64ImageProcessor.from_array(array, image_format)
+
+
+# Stocker l'image décodée dans le magasin et renvoyer son identifiant
+async def store_image(processor):
+    image_id = await pool.run(store.image_hash, processor.array, processor.image_format)
+    try:
+        store.put(processor.array, processor.image_format, image_id)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    height, width = processor.array.shape[:2]
+    return {"image_id": image_id, "width": width, "height": height}
+
+
+# Encoder l'image du processeur dans le pool de travail
+async def encode_processor(processor, image_format=None, quality=None, compression=None, as_base64=False):
+    try:
+        return await pool.run(encode_array, processor.array, processor.image_format, image_format, quality,
+                              compression, as_base64)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# Découper une image encodée en morceaux pour la renvoyer en streaming
+def iter_chunks(data, chunk_size=64 * 1024):
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+# Encoder l'image du processeur et la renvoyer en binaire
+async def image_response(processor, image_format=None, quality=None, compression=None, filename=None):
+    try:
+        output_format = normalize_format(image_format or processor.image_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    image_bytes = await encode_processor(processor, output_format, quality, compression)
+
+    headers = {"Content-Length": str(len(image_bytes))}
+    if filename is not None:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}.{output_format.lower()}"'
+    return StreamingResponse(iter_chunks(image_bytes), media_type=get_mime_type(output_format), headers=headers)
+
+
+@app.post("/upload_image")
+async def upload_image(base64_image: str = Form(...)):
+    return await store_image(await decode_payload(base64_image))
+
+
+@app.post("/upload_file")
+async def upload_file(file: UploadFile = File(...)):
+    return await store_image(await decode_upload(await file.read()))
+
+
 @app.post("/histogram/")
-async def get_histogram(base64_image: str = Form(...)):
-    processor = Base64ImageProcessor(base64_image)
+async def get_histogram(base64_image: Union[str, None] = Form(None), image_id: Union[str, None] = Form(None),
+                        edits: Union[str, None] = Form(None), bins: int = Form(256), cumulative: bool = Form(False),
+                        statistics: bool = Form(False), step: int = Form(1), max_edge: Union[int, None] = Form(None)):
+    processor = await load_processor(base64_image, image_id, edits, max_edge)
 
-    result = processor.calculate_histogram()
+    try:
+        result = await pool.run(compute_histogram, processor.array, bins=bins, cumulative=cumulative,
+                                statistics=statistics, step=step)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    if isinstance(result, tuple):  # Check if it's a tuple (indicating 3 values) -> colored image
-        hist_blue, hist_green, hist_red = result
-        return JSONResponse(content={"hist_blue": hist_blue.tolist(),
-                                 "hist_green": hist_green.tolist(),
-                                 "hist_red": hist_red.tolist(), "type":"rgb"})
-    else: # if image is black and white
-        result = [int(i) for i in result]
-        return JSONResponse(content={"hist": result, "type":"bw"})
-    
+    return JSONResponse(content=result)
 
 
 @app.post("/edit_image")
-async def apply_edits(base64_image: str = Form(...), edits: str = Form(...)):
-    json_edits = json.loads(edits)
-    for method_name, args in json_edits.items():
-        obj = Base64ImageProcessor(base64_image)
-        if 'enabled' not in args:
-            continue
-        if not args['enabled']:
-            continue
-        if hasattr(obj, method_name):
-            method = getattr(obj, method_name)
-            if callable(method):
-                args.pop('enabled')
-                args = {k.lower(): v for k, v in args.items()}
-                method(**args)
-                base64_image = obj.get_base64_image()
-        
-    return {"message": "Éditions appliquées avec succès.", "base64_image": base64_image}
\ No newline at end of file
+async def apply_edits(base64_image: Union[str, None] = Form(None), image_id: Union[str, None] = Form(None),
+                      edits: str = Form(...), image_format: Union[str, None] = Form(None),
+                      quality: Union[int, None] = Form(None), compression: Union[int, None] = Form(None)):
+    if image_id is None and base64_image is not None:
+        try:
+            base64_image = await pool.run(parse_pipeline(edits).apply, base64_image, image_format, quality, compression)
+        except binascii.Error:
+            raise HTTPException(status_code=400, detail="Données base64 invalides")
+        except (UnsupportedImageFormat, OSError):
+            raise HTTPException(status_code=415, detail="Format d'image non pris en charge")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        processor = await load_processor(base64_image, image_id, edits)
+        base64_image = await encode_processor(processor, image_format, quality, compression, as_base64=True)
+
+    return {"message": "Éditions appliquées avec succès.", "base64_image": base64_image}
+
+
+# Variante binaire de /edit_image : l'image est envoyée en multipart (ou désignée par son
+# identifiant) et le résultat est renvoyé directement en octets, sans passer par le base64
+@app.post("/edit_file")
+async def apply_edits_file(file: Union[UploadFile, None] = File(None), image_id: Union[str, None] = Form(None),
+                           edits: str = Form("{}"), image_format: Union[str, None] = Form(None),
+                           quality: Union[int, None] = Form(None), compression: Union[int, None] = Form(None)):
+    if file is not None:
+        processor = await decode_upload(await file.read())
+        outputs = await pool.run(run_stages, processor.array, processor.image_format, parse_pipeline(edits).stages)
+        if outputs:
+            processor.array = outputs[-1]
+    elif image_id is not None:
+        processor = await load_processor(None, image_id, edits)
+    else:
+        raise HTTPException(status_code=422, detail="file ou image_id est requis")
+
+    return await image_response(processor, image_format, quality, compression)
+
+
+# Aperçu interactif : la recette est appliquée sur une version réduite de l'image stockée
+@app.post("/preview")
+async def preview_edits(image_id: str = Form(...), edits: str = Form(...),
+                        max_edge: int = Form(DEFAULT_PREVIEW_EDGE), image_format: Union[str, None] = Form(None),
+                        quality: Union[int, None] = Form(None), compression: Union[int, None] = Form(None)):
+    processor = await load_processor(None, image_id, edits, max_edge)
+    base64_image = await encode_processor(processor, image_format, quality, compression, as_base64=True)
+
+    height, width = processor.array.shape[:2]
+    return {"message": "Aperçu généré avec succès.", "base64_image": base64_image, "width": width, "height": height}
+
+
+# Édition en direct : le client n'envoie que les modifications de la recette et reçoit l'aperçu
+# et l'histogramme de la dernière version (voir live.LiveSession)
+@app.websocket("/ws/edit")
+async def live_edit(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        await LiveSession(websocket, store, pool).run()
+    except WebSocketDisconnect:
+        pass
+
+
+# Export : la même recette appliquée à pleine résolution, renvoyée en fichier binaire
+@app.post("/export")
+async def export_image(image_id: str = Form(...), edits: str = Form(...), image_format: Union[str, None] = Form(None),
+                       quality: Union[int, None] = Form(None), compression: Union[int, None] = Form(None)):
+    processor = await load_processor(None, image_id, edits)
+    return await image_response(processor, image_format, quality, compression, filename="image")
+
+
+# Traitement par lots : la même recette est appliquée à toutes les images d'une archive ZIP.
+# Les images sont traitées en parallèle dans le pool de travail et les résultats sont renvoyés au fur
+# et à mesure, en archive ZIP (output="zip") ou en NDJSON avec une ligne par image (output="ndjson")
+@app.post("/batch")
+async def batch_edit(file: UploadFile = File(...), edits: str = Form(...), output: str = Form("zip"),
+                     image_format: Union[str, None] = Form(None), quality: Union[int, None] = Form(None),
+                     compression: Union[int, None] = Form(None)):
+    if output not in BATCH_OUTPUTS:
+        raise HTTPException(status_code=400, detail=f"output doit valoir {' ou '.join(BATCH_OUTPUTS)}")
+    try:
+        if image_format is not None:
+            image_format = normalize_format(image_format)
+        stages = EditPipeline(edits).stages
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # L'archive est recopiée dans un fichier temporaire qui reste ouvert pendant toute la réponse :
+    # les images y sont lues une à une, l'archive n'est jamais chargée entièrement en mémoire
+    source = tempfile.TemporaryFile()
+    await asyncio.to_thread(shutil.copyfileobj, file.file, source)
+    try:
+        archive = zipfile.ZipFile(source)
+    except zipfile.BadZipFile:
+        source.close()
+        raise HTTPException(status_code=415, detail="L'archive ZIP est invalide")
+
+    results = run_batch(iter_zip(archive), stages, pool, output_format=image_format, quality=quality,
+                        compression=compression, as_base64=output == "ndjson")
+
+    async def stream():
+        try:
+            async for chunk in (zip_stream(results) if output == "zip" else ndjson_stream(results)):
+                yield chunk
+        finally:
+            archive.close()
+            source.close()
+
+    if output == "zip":
+        return StreamingResponse(stream(), media_type="application/zip",
+                                 headers={"Content-Disposition": 'attachment; filename="batch.zip"'})
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
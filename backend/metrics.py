@@ -0,0 +1,109 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# Bornes (en secondes) des intervalles des histogrammes de latence
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Durées mesurées pendant la tâche ou la requête en cours : liste de (étape, secondes), ou None
+# si personne ne les collecte
+stage_timings = ContextVar("stage_timings", default=None)
+
+
+# Histogramme de latence au format Prometheus, avec une seule étiquette (label)
+class Histogram:
+    def __init__(self, name, description, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        with self.lock:
+            counts, total, count = self.series.get(label_value, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            self.series[label_value] = (counts, total + seconds, count + 1)
+
+    # Lignes au format texte d'exposition de Prometheus (les compteurs des intervalles sont cumulés)
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = sorted((value, list(counts), total, count)
+                            for value, (counts, total, count) in self.series.items())
+        for value, counts, total, count in series:
+            label = f'{self.label}="{value}"'
+            for bound, n in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {n}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return lines
+
+
+STAGE_DURATION = Histogram("image_stage_duration_seconds",
+                           "Durée des étapes de traitement d'image (décodage, éditions, encodage, histogramme)",
+                           "stage")
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Durée des requêtes HTTP", "path")
+
+
+# Mesurer la durée d'une étape ; elle est ajoutée aux durées collectées pour la tâche en cours
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def record(stage, seconds):
+    timings = stage_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+# Collecter les durées des étapes mesurées dans le bloc
+@contextmanager
+def collect():
+    timings = []
+    token = stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        stage_timings.reset(token)
+
+
+# Exécuté dans le pool de travail : renvoie (résultat, durées des étapes de la tâche), les durées
+# étant ensuite rapportées par le processus principal (voir report)
+def collect_timings(func, *args, **kwargs):
+    with collect() as timings:
+        result = func(*args, **kwargs)
+    return result, timings
+
+
+# Rapporter les durées d'une tâche : histogrammes de /metrics et durées de la requête en cours
+def report(timings):
+    for stage, seconds in timings:
+        STAGE_DURATION.observe(stage, seconds)
+        record(stage, seconds)
+
+
+# En-tête Server-Timing : durée cumulée de chaque étape (en millisecondes), puis durée totale
+def server_timing(timings, total):
+    durations = {}
+    for stage, seconds in timings:
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in durations.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+# Contenu de l'endpoint /metrics
+def render_metrics():
+    return "\n".join(STAGE_DURATION.render() + REQUEST_DURATION.render()) + "\n"
@@ -0,0 +1,190 @@
+import inspect
+import json
+from image_processor import Base64ImageProcessor, EDIT_METHODS, downscale
+from lut import POINT_OPERATIONS
+
+
+# Taille maximale par défaut (plus grand côté, en pixels) des aperçus
+DEFAULT_PREVIEW_EDGE = 1024
+
+
+# Transformer une recette d'édition (dict JSON envoyé par le frontend) en une liste
+# ordonnée d'étapes (nom de la méthode, arguments)
+def parse_edits(edits):
+    if isinstance(edits, str):
+        edits = json.loads(edits)
+    if not isinstance(edits, dict):
+        raise ValueError("La recette d'édition doit être un objet JSON")
+
+    stages = []
+    for method_name, args in edits.items():
+        # Ignorer les éditions désactivées ou inconnues
+        if not isinstance(args, dict) or not args.get('enabled'):
+            continue
+        if method_name not in EDIT_METHODS:
+            continue
+        kwargs = {k.lower(): v for k, v in args.items() if k != 'enabled'}
+        stages.append((method_name, kwargs))
+    return stages
+
+
+# Valeur d'un paramètre d'étape, ou sa valeur par défaut dans la méthode du processeur
+def stage_param(method_name, kwargs, name):
+    if name in kwargs:
+        return kwargs[name]
+    return inspect.signature(getattr(Base64ImageProcessor, method_name)).parameters[name].default
+
+
+# Les tailles de voisinage des filtres sont exprimées en pixels : elles suivent l'échelle de l'image.
+# La parité est conservée : une fenêtre impaire reste centrée sur le pixel (une taille paire décalerait
+# l'aperçu d'un demi-pixel par rapport à l'export)
+def scale_size(method_name, kwargs, scale):
+    size = stage_param(method_name, kwargs, "size")
+    if size % 2:
+        scaled = 2 * round((size - 1) * scale / 2) + 1
+    else:
+        scaled = max(1, 2 * round(size * scale / 2))
+    return {**kwargs, "size": scaled}
+
+
+# Les seuils de Canny portent sur l'amplitude du gradient par pixel. Réduire l'image ne change pas
+# un contour franc mais raidit d'un facteur 1/scale les transitions douces ; on divise donc les seuils
+# par la racine de l'échelle, ce qui donne en pratique la même densité de contours qu'à pleine résolution
+def scale_thresholds(method_name, kwargs, scale):
+    factor = scale ** -0.5
+    return {**kwargs,
+            "threshold1": stage_param(method_name, kwargs, "threshold1") * factor,
+            "threshold2": stage_param(method_name, kwargs, "threshold2") * factor}
+
+
+# Règles d'adaptation des paramètres qui dépendent de la taille de l'image
+PROXY_SCALING = {
+    "maximum": scale_size,
+    "minimum": scale_size,
+    "median": scale_size,
+    "mean": scale_size,
+    "edges": scale_thresholds,
+}
+
+
+# Adapter les étapes d'une recette pour l'appliquer sur une image réduite d'un facteur scale
+def scale_stages(stages, scale):
+    if scale == 1.0:
+        return stages
+    return [(method_name, PROXY_SCALING[method_name](method_name, kwargs, scale)
+             if method_name in PROXY_SCALING else kwargs)
+            for method_name, kwargs in stages]
+
+
+# Regrouper les opérations ponctuelles consécutives d'une recette : chaque groupe est compilé en
+# une seule table de correspondance ; les autres étapes forment chacune leur propre groupe
+def group_stages(stages):
+    groups = []
+    for stage in stages:
+        if groups and stage[0] in POINT_OPERATIONS and groups[-1][-1][0] in POINT_OPERATIONS:
+            groups[-1].append(stage)
+        else:
+            groups.append([stage])
+    return groups
+
+
+# Appliquer un groupe d'étapes (voir group_stages) sur un processeur
+def run_group(processor, group):
+    if group[0][0] in POINT_OPERATIONS:
+        processor.point_operations(group)
+    else:
+        method_name, kwargs = group[0]
+        getattr(processor, method_name)(**kwargs)
+
+
+# Fonctions de calcul exécutées par le pool de travail (voir executor.py). Elles ne reçoivent et ne
+# renvoient que des tableaux numpy et des données simples, pour pouvoir passer dans un autre processus
+
+# Décoder une image base64 ; renvoie (tableau, format)
+def decode_base64(base64_image):
+    processor = Base64ImageProcessor(base64_image)
+    return processor.array, processor.image_format
+
+
+# Décoder les octets bruts d'un fichier image ; renvoie (tableau, format)
+def decode_bytes(image_bytes):
+    processor = Base64ImageProcessor.from_bytes(image_bytes)
+    return processor.array, processor.image_format
+
+
+# Appliquer des étapes sur un tableau ; renvoie le résultat de chaque étape (pour le cache des préfixes),
+# ou None pour une étape fusionnée avec les suivantes dans une même table de correspondance
+def run_stages(array, image_format, stages):
+    processor = Base64ImageProcessor.from_array(array, image_format)
+    outputs = []
+    for group in group_stages(stages):
+        run_group(processor, group)
+        outputs.extend([None] * (len(group) - 1) + [processor.array])
+    return outputs
+
+
+# Encoder un tableau en octets, ou en chaîne base64 si as_base64 est vrai
+def encode_array(array, image_format, output_format=None, quality=None, compression=None, as_base64=False):
+    processor = Base64ImageProcessor.from_array(array, image_format)
+    if as_base64:
+        return processor.get_base64_image(output_format, quality, compression)
+    return processor.encode(output_format, quality, compression)
+
+
+# Créer si besoin la version réduite (proxy) d'une image stockée, dans le pool de travail.
+# Renvoie (identifiant du proxy dans le magasin, facteur d'échelle)
+async def load_proxy(store, image_id, pool, max_edge=DEFAULT_PREVIEW_EDGE):
+    proxy_id, scale = store.proxy_info(image_id, max_edge)
+    if proxy_id not in store:
+        array, image_format = store.get(image_id)
+        proxy, scale = await pool.run(downscale, array, max_edge)
+        store.put_proxy(proxy_id, proxy, image_format)
+    return proxy_id, scale
+
+
+# Moteur d'édition : l'image est décodée une seule fois, toute la chaîne d'éditions
+# est appliquée sur le tableau numpy en mémoire, puis l'image est encodée une seule fois
+class EditPipeline:
+    def __init__(self, edits):
+        self.stages = parse_edits(edits)
+
+    # Créer un moteur à partir d'étapes déjà analysées
+    @classmethod
+    def from_stages(cls, stages):
+        pipeline = cls({})
+        pipeline.stages = stages
+        return pipeline
+
+    # Appliquer les étapes sur un processeur déjà décodé
+    def run(self, processor):
+        for group in group_stages(self.stages):
+            run_group(processor, group)
+        return processor
+
+    # Décoder, éditer puis ré-encoder une image base64 (options d'encodage : voir Base64ImageProcessor.encode)
+    def apply(self, base64_image, image_format=None, quality=None, compression=None):
+        # Aucune édition ni option d'encodage : renvoyer l'image telle quelle, sans perte de ré-encodage
+        if not self.stages and image_format is None and quality is None and compression is None:
+            return base64_image
+        processor = self.run(Base64ImageProcessor(base64_image))
+        return processor.get_base64_image(image_format, quality, compression)
+
+    # Appliquer la recette sur une image du magasin, dans le pool de travail, en repartant du plus
+    # long préfixe de la recette déjà calculé et en mémorisant le résultat de chaque nouvelle étape
+    async def render(self, store, image_id, pool):
+        _, image_format = store.get(image_id)
+        start, array = store.longest_prefix(image_id, self.stages)
+
+        if start < len(self.stages):
+            outputs = await pool.run(run_stages, array, image_format, self.stages[start:])
+            for n, output in enumerate(outputs, start + 1):
+                if output is not None:
+                    store.put_result(image_id, self.stages[:n], output)
+            array = outputs[-1]
+        return Base64ImageProcessor.from_array(array, image_format)
+
+    # Aperçu : appliquer la recette sur une version réduite (proxy) de l'image stockée,
+    # avec des paramètres adaptés à l'échelle pour que l'aperçu corresponde à l'export
+    async def preview(self, store, image_id, pool, max_edge=DEFAULT_PREVIEW_EDGE):
+        proxy_id, scale = await load_proxy(store, image_id, pool, max_edge)
+        return await self.from_stages(scale_stages(self.stages, scale)).render(store, proxy_id, pool)
@@ -0,0 +1,71 @@
+import io
+import json
+import zipfile
+import numpy as np
+import pytest
+from PIL import Image
+import batch
+
+
+# Traitement par lots : chaque image réussie donne un résultat, sous un nom unique.
+# À lancer depuis le dossier backend : python -m pytest -q
+
+def encode(image_format):
+    buffer = io.BytesIO()
+    Image.fromarray(np.full((8, 8, 3), 128, np.uint8)).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("name, image_format, expected", [
+    ("a.png", "PNG", "a.png"),
+    ("a.jpg", "JPEG", "a.jpg"),
+    ("a.jpeg", "JPEG", "a.jpeg"),
+    ("a.png", "WEBP", "a.png.webp"),
+    ("a.jpg", "WEBP", "a.jpg.webp"),
+    ("dir/a.GIF", "GIF", "dir/a.GIF"),
+])
+def test_output_name(name, image_format, expected):
+    assert batch.output_name(name, image_format) == expected
+
+
+def test_unique_name():
+    used = set()
+    assert [batch.unique_name(name, used) for name in ("a.png", "a.png", "A.PNG", "b/a.png")] == [
+        "a.png", "a-1.png", "A-2.PNG", "b/a.png"]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "photos.zip"
+    with zipfile.ZipFile(path, "w") as f:
+        f.writestr("a.png", encode("PNG"))
+        f.writestr("a.jpg", encode("JPEG"))
+        f.writestr("a.jpeg", encode("JPEG"))
+        f.writestr("../a.png", encode("PNG"))
+    return path
+
+
+def statuses(lines):
+    return sorted((status["name"], status["output"]) for status in map(json.loads, lines))
+
+
+@pytest.mark.parametrize("output_format, expected", [
+    (None, [("a.jpeg", "a.jpeg"), ("a.jpg", "a.jpg"), ("a.png", "a-1.png"), ("a.png", "a.png")]),
+    ("webp", [("a.jpeg", "a.jpeg.webp"), ("a.jpg", "a.jpg.webp"), ("a.png", "a.png-1.webp"),
+              ("a.png", "a.png.webp")]),
+])
+def test_batch_keeps_every_result(archive, tmp_path, capsys, output_format, expected):
+    options = ["--edits", "{}", "--backend", "thread", "--workers", "2"]
+    if output_format:
+        options += ["--format", output_format]
+
+    batch.main([str(archive), str(tmp_path / "results.zip")] + options)
+    with zipfile.ZipFile(tmp_path / "results.zip") as results:
+        names = results.namelist()
+        assert len(names) == len(set(names)) == 5
+        assert statuses(results.read("status.ndjson").decode().splitlines()) == expected
+
+    batch.main([str(archive), str(tmp_path / "results")] + options)
+    found = statuses(capsys.readouterr().out.splitlines())
+    assert found == expected
+    assert sorted(path.name for path in (tmp_path / "results").iterdir()) == sorted(output for _, output in found)
@@ -0,0 +1,54 @@
+import asyncio
+import time
+import pytest
+from executor import JobTimeout, WorkerPool, deadline
+
+
+# Délai des tâches du pool de travail : les tâches d'une même requête partagent son échéance.
+# À lancer depuis le dossier backend : python -m pytest -q
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool("thread", 2, queue_size=2, timeout=0.5)
+    yield pool
+    pool.shutdown()
+
+
+def test_jobs_share_the_request_deadline(pool):
+    async def request():
+        with deadline(0.5):
+            await pool.run(sleep, 0.3)
+            await pool.run(sleep, 0.3)
+
+    # Chaque tâche tient dans le délai du pool, mais pas les deux ensemble
+    start = time.monotonic()
+    with pytest.raises(JobTimeout):
+        asyncio.run(request())
+    assert time.monotonic() - start < 0.7
+
+
+def test_expired_deadline_fails_without_running_the_job(pool):
+    calls = []
+
+    async def request():
+        with deadline(0):
+            await pool.run(calls.append, 1)
+
+    with pytest.raises(JobTimeout):
+        asyncio.run(request())
+    assert not calls
+
+
+def test_pool_timeout_applies_without_deadline(pool):
+    async def jobs():
+        assert await pool.run(sleep, 0.3) == 0.3
+        assert await pool.run(sleep, 0.3) == 0.3
+        await pool.run(sleep, 0.7)
+
+    with pytest.raises(JobTimeout):
+        asyncio.run(jobs())
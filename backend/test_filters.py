@@ -0,0 +1,72 @@
+import time
+import numpy as np
+import pytest
+from scipy import ndimage
+import filters
+
+
+# Les filtres de voisinage donnent le même résultat que scipy.ndimage (mode "reflect"), canal par
+# canal, le canal alpha n'étant jamais modifié.
+# À lancer depuis le dossier backend : python -m pytest -q
+
+MODES = ("L", "RGB", "RGBA")
+SIZES = (0, 1, 2, 3, 4, 5, 9, 15)
+
+
+def make_image(mode, height=61, width=47, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = {"L": (height, width), "RGB": (height, width, 3), "RGBA": (height, width, 4)}[mode]
+    return rng.integers(0, 256, shape, dtype=np.uint8)
+
+
+SCIPY_FILTERS = {
+    "minimum": ndimage.minimum_filter,
+    "maximum": ndimage.maximum_filter,
+    "mean": ndimage.uniform_filter,
+    "median": ndimage.median_filter,
+}
+
+
+def scipy_reference(name, array, size):
+    if size <= 1:
+        return array
+    if array.ndim == 2:
+        return SCIPY_FILTERS[name](array, size=size, mode="reflect")
+    expected = array.copy()
+    for c in range(3):
+        expected[:, :, c] = SCIPY_FILTERS[name](array[:, :, c], size=size, mode="reflect")
+    return expected
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("name", ("minimum", "maximum", "median"))
+@pytest.mark.parametrize("size", SIZES)
+def test_filter_matches_scipy(mode, name, size):
+    array = make_image(mode)
+    result = getattr(filters, name)(array, size)
+    if name == "median":
+        size = filters.median_size(size)
+    np.testing.assert_array_equal(result, scipy_reference(name, array, size))
+
+
+# Une taille paire de médiane est arrondie à la taille impaire supérieure : même résultat, et
+# même temps de calcul (medianBlur), quelle que soit la parité
+@pytest.mark.parametrize("size", (30, 60, 254))
+def test_even_median_uses_next_odd_size(size):
+    array = make_image("RGB", 500, 500)
+    start = time.perf_counter()
+    result = filters.median(array, size)
+    assert time.perf_counter() - start < 2
+    np.testing.assert_array_equal(result, filters.median(array, size + 1))
+
+
+# La moyenne arrondit une seule fois (voir filters.mean) : une ou deux intensités d'écart au plus
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("size", SIZES)
+def test_mean_matches_scipy_within_rounding(mode, size):
+    array = make_image(mode)
+    result = filters.mean(array, size)
+    expected = scipy_reference("mean", array, size)
+    assert np.abs(result.astype(int) - expected).max() <= 2
+    if mode == "RGBA":
+        np.testing.assert_array_equal(result[:, :, 3], array[:, :, 3])
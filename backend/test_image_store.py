@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+from image_store import ImageStore, ImageTooLarge, prefix_key
+
+
+# Éviction et comptabilité du budget du magasin d'images.
+# À lancer depuis le dossier backend : python -m pytest -q
+
+KB = 1024
+
+STAGES = [("median", {"size": 3})]
+
+
+def image(kilobytes, value=0):
+    return np.full(kilobytes * KB, value, np.uint8)
+
+
+# Le total compté doit toujours être la somme des entrées présentes
+def assert_accounting(store):
+    assert store.image_bytes == sum(nbytes for _, nbytes in store.images.values())
+    assert store.result_bytes == sum(nbytes for _, nbytes in store.results.values())
+    assert store.nbytes == store.image_bytes + store.result_bytes <= store.max_bytes
+
+
+def test_results_are_evicted_before_images():
+    store = ImageStore(max_bytes=100 * KB)
+    a = store.put(image(30, 1), "PNG")
+    store.put_result(a, STAGES, image(20))
+    store.put_result(a, STAGES * 2, image(20))
+    b = store.put(image(60, 2), "PNG")
+    # 30 Ko manquaient : les deux résultats sont évincés, les deux images restent
+    assert a in store and b in store
+    assert not store.results
+    assert_accounting(store)
+
+
+def test_least_recently_used_result_is_evicted_first():
+    store = ImageStore(max_bytes=100 * KB)
+    a = store.put(image(40, 1), "PNG")
+    store.put_result(a, STAGES, image(25))
+    store.put_result(a, STAGES * 2, image(25))
+    store.longest_prefix(a, STAGES)
+    store.put_result(a, STAGES * 3, image(25))
+    assert prefix_key(a, STAGES) in store.results
+    assert prefix_key(a, STAGES * 2) not in store.results
+    assert_accounting(store)
+
+
+def test_result_never_evicts_an_image():
+    store = ImageStore(max_bytes=100 * KB)
+    a = store.put(image(45, 1), "PNG")
+    b = store.put(image(45, 2), "PNG")
+    store.put_result(a, STAGES, image(20))
+    assert a in store and b in store
+    assert not store.results
+    assert_accounting(store)
+
+
+def test_oversized_result_is_not_cached():
+    store = ImageStore(max_bytes=100 * KB)
+    a = store.put(image(10), "PNG")
+    store.put_result(a, STAGES, image(30))
+    assert not store.results
+    assert store.longest_prefix(a, STAGES)[0] == 0
+    assert_accounting(store)
+
+
+def test_proxy_never_evicts_its_source():
+    store = ImageStore(max_bytes=100 * KB)
+    a = store.put(image(70, 1), "PNG")
+    b = store.put(image(20, 2), "PNG")
+    store.put_proxy(f"{a}@64", image(20), "PNG")
+    # La place est faite en évinçant l'autre image, jamais la source du proxy
+    assert a in store and f"{a}@64" in store
+    assert b not in store
+    assert_accounting(store)
+
+
+def test_proxy_may_exceed_budget_when_only_its_source_remains():
+    store = ImageStore(max_bytes=100 * KB)
+    a = store.put(image(90), "PNG")
+    store.put_proxy(f"{a}@64", image(20), "PNG")
+    assert a in store and f"{a}@64" in store
+    assert store.nbytes == 110 * KB
+
+
+def test_evicting_an_image_drops_its_proxies_and_results():
+    store = ImageStore(max_bytes=100 * KB)
+    a = store.put(image(40, 1), "PNG")
+    store.put_proxy(f"{a}@64", image(10), "PNG")
+    store.put_result(a, STAGES, image(10))
+    store.put_result(f"{a}@64", STAGES, image(5))
+    b = store.put(image(10, 2), "PNG")
+    store.put_result(b, STAGES, image(5))
+
+    store.put(image(60, 3), "PNG")
+    assert a not in store and f"{a}@64" not in store
+    assert all(key[0] == b for key in store.results)
+    assert b in store
+    assert_accounting(store)
+
+
+def test_drop_image_removes_everything_derived_from_it():
+    store = ImageStore(max_bytes=100 * KB)
+    a = store.put(image(20, 1), "PNG")
+    b = store.put(image(20, 2), "PNG")
+    store.put_proxy(f"{a}@64", image(5), "PNG")
+    store.put_result(a, STAGES, image(5))
+    store.put_result(f"{a}@64", STAGES, image(5))
+    store.put_result(b, STAGES, image(5))
+
+    store._drop_image(a)
+    assert list(store.images) == [b]
+    assert list(store.results) == [prefix_key(b, STAGES)]
+    assert_accounting(store)
+
+
+def test_oversized_image_raises_without_evicting_anything():
+    store = ImageStore(max_bytes=100 * KB)
+    a = store.put(image(50), "PNG")
+    store.put_result(a, STAGES, image(10))
+    with pytest.raises(ImageTooLarge):
+        store.put(image(101), "PNG")
+    assert a in store and prefix_key(a, STAGES) in store.results
+    assert_accounting(store)
+
+
+def test_accounting_matches_entries_after_any_sequence():
+    rng = np.random.default_rng(0)
+    store = ImageStore(max_bytes=200 * KB)
+    ids = []
+    for step in range(500):
+        action = rng.integers(4)
+        if action == 0 or not ids:
+            ids.append(store.put(image(int(rng.integers(1, 80)), step % 256), "PNG"))
+        else:
+            image_id = ids[rng.integers(len(ids))]
+            if image_id not in store:
+                continue
+            if action == 1:
+                store.put_result(image_id, STAGES * int(rng.integers(1, 5)), image(int(rng.integers(1, 60))))
+            elif action == 2:
+                store.put_proxy(f"{image_id}@{rng.integers(1, 4)}", image(int(rng.integers(1, 20))), "PNG")
+            else:
+                store.longest_prefix(image_id, STAGES * int(rng.integers(1, 5)))
+        assert store.image_bytes == sum(nbytes for _, nbytes in store.images.values())
+        assert store.result_bytes == sum(nbytes for _, nbytes in store.results.values())
+        # Seuls un proxy et sa source peuvent ensemble dépasser le budget
+        assert store.result_bytes == 0 or store.nbytes <= store.max_bytes
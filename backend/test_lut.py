@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from lut import GRAYSCALE_WEIGHTS, GRAYSCALE_WEIGHTS_10000, PointProgram
+
+
+# Les tables de correspondance des opérations ponctuelles donnent le même résultat que les anciennes
+# formules pixel par pixel, sur des images L, RGB et RGBA (le canal alpha n'est jamais modifié).
+# À lancer depuis le dossier backend : python -m pytest -q
+
+MODES = ("L", "RGB", "RGBA")
+
+
+def make_image(mode, height=97, width=131, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = {"L": (height, width), "RGB": (height, width, 3), "RGBA": (height, width, 4)}[mode]
+    return rng.integers(0, 256, shape, dtype=np.uint8)
+
+
+def old_contrast(channel, value):
+    contrast_adjusted = (value / 100) * 510 - 255
+    f = (259 * (contrast_adjusted + 255)) / (255 * (259 - contrast_adjusted))
+    return np.clip(f * (channel.astype(np.float32) - 128) + 128, 0, 255).astype(np.uint8)
+
+
+def old_luminance(channel, value):
+    return np.clip(channel * (value / 50), 0, 255).astype(np.uint8)
+
+
+# Partie entière exacte de 0.2989 * R + 0.5870 * G + 0.1140 * B (voir lut.grayscale_table)
+def exact_grayscale(array):
+    rgb = array[:, :, :3].astype(np.int64)
+    weights = GRAYSCALE_WEIGHTS_10000
+    return ((weights[0] * rgb[:, :, 0] + weights[1] * rgb[:, :, 1] + weights[2] * rgb[:, :, 2]) // 10000).astype(
+        np.uint8)
+
+
+OLD_FORMULAS = {"contrast": old_contrast, "luminance": old_luminance}
+
+
+def old_point_operations(array, stages):
+    array = array.copy()
+    for method_name, kwargs in stages:
+        if method_name == "grayscale":
+            if array.ndim == 3:
+                array = exact_grayscale(array)
+        elif array.ndim == 2:
+            array = OLD_FORMULAS[method_name](array, **kwargs)
+        else:
+            for c in range(3):
+                array[:, :, c] = OLD_FORMULAS[method_name](array[:, :, c], **kwargs)
+    return array
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("stages", [
+    [("contrast", {"value": 70})],
+    [("contrast", {"value": 0})],
+    [("contrast", {"value": 100})],
+    [("luminance", {"value": 60})],
+    [("luminance", {"value": 20})],
+    [("grayscale", {})],
+    [("contrast", {"value": 30}), ("luminance", {"value": 80}), ("contrast", {"value": 65})],
+    [("contrast", {"value": 70}), ("grayscale", {}), ("luminance", {"value": 60})],
+    [("luminance", {"value": 45}), ("grayscale", {}), ("contrast", {"value": 90}), ("grayscale", {})],
+])
+def test_point_program_matches_old_formulas(mode, stages):
+    array = make_image(mode)
+    np.testing.assert_array_equal(PointProgram(stages).apply(array), old_point_operations(array, stages))
+
+
+# Toutes les combinaisons (R, G, B), une valeur de R à la fois : la conversion en virgule fixe donne
+# la partie entière exacte de la somme pondérée. Elle ne s'écarte de l'ancien calcul en float64 que
+# lorsque cette somme est entière (le float64 donne alors parfois l'entier inférieur).
+# Les références sont calculées sur les tables des 256 valeurs possibles de chaque canal
+def test_grayscale_matches_exact_formula_on_every_color():
+    program = PointProgram([("grayscale", {})])
+    values = np.arange(256)
+    green, blue = np.meshgrid(values, values, indexing="ij")
+    weighted = [weight * values for weight in GRAYSCALE_WEIGHTS_10000]
+    products = [weight * values for weight in GRAYSCALE_WEIGHTS]
+    for red in range(256):
+        array = np.dstack([np.full((256, 256), red), green, blue]).astype(np.uint8)
+        result = program.apply(array)
+
+        exact_sum = weighted[0][red] + weighted[1][:, None] + weighted[2][None, :]
+        np.testing.assert_array_equal(result, exact_sum // 10000)
+
+        old = (products[0][red] + products[1][:, None] + products[2][None, :]).astype(np.uint8)
+        differs = result != old
+        assert not (differs & (exact_sum % 10000 != 0)).any()
+        assert (result[differs].astype(int) - old[differs] == 1).all()
@@ -0,0 +1,25 @@
+import pytest
+from pipeline import scale_stages
+
+
+# Adaptation des recettes aux aperçus réduits (voir pipeline.scale_stages).
+# À lancer depuis le dossier backend : python -m pytest -q
+
+@pytest.mark.parametrize("size, scale, expected", [
+    (5, 0.3, 3),
+    (101, 0.5, 51),
+    (101, 0.256, 27),
+    (3, 0.1, 1),
+    (1, 0.5, 1),
+    (8, 0.5, 4),
+    (2, 0.2, 1),
+    (60, 0.25, 16),
+])
+def test_scaled_size_keeps_parity(size, scale, expected):
+    [(_, kwargs)] = scale_stages([("median", {"size": size})], scale)
+    assert kwargs["size"] == expected
+
+
+def test_scaled_size_uses_method_default():
+    [(_, kwargs)] = scale_stages([("mean", {})], 0.5)
+    assert kwargs["size"] == 1
@@ -0,0 +1,72 @@
+import numpy as np
+import cv2
+import pytest
+from image_processor import Base64ImageProcessor
+from tiling import TilingConfig
+
+
+# Le traitement par tuiles donne le même résultat que le traitement d'un seul bloc.
+# À lancer depuis le dossier backend : python -m pytest -q
+
+MODES = ("L", "RGB", "RGBA")
+FILTERS = ("minimum", "maximum", "mean", "median")
+SIZES = (2, 3, 4, 5, 9)
+
+# Tuiles bien plus petites que l'image, pour que les halos et les bords des tuiles soient éprouvés
+SMALL_TILES = TilingConfig(tile_size=128, min_megapixels=0)
+
+
+# Image de test reproductible : bruit lissé (contours et chaînes de Canny qui traversent les tuiles),
+# avec un canal alpha différent des canaux de couleur
+def make_image(mode, height=300, width=410, seed=0):
+    rng = np.random.default_rng(seed)
+    channels = 1 if mode == "L" else 3
+    noise = rng.integers(0, 256, (height, width, channels), dtype=np.uint8)
+    array = cv2.GaussianBlur(noise, (0, 0), 2).reshape(height, width, channels)
+    array = cv2.normalize(array, None, 0, 255, cv2.NORM_MINMAX)
+    if mode == "L":
+        return array.reshape(height, width)
+    if mode == "RGBA":
+        alpha = rng.integers(0, 256, (height, width, 1), dtype=np.uint8)
+        array = np.concatenate([array, alpha], axis=2)
+    return np.ascontiguousarray(array)
+
+
+def processor(array, tiling=None):
+    p = Base64ImageProcessor.from_array(array.copy())
+    p.tiling = tiling
+    return p
+
+
+# Traitement par tuiles
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("name", FILTERS)
+@pytest.mark.parametrize("size", SIZES)
+def test_tiled_filter_matches_untiled(mode, name, size):
+    array = make_image(mode)
+    untiled, tiled = processor(array), processor(array, SMALL_TILES)
+    getattr(untiled, name)(size)
+    getattr(tiled, name)(size)
+    np.testing.assert_array_equal(tiled.array, untiled.array)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_tiled_point_operations_match_untiled(mode):
+    array = make_image(mode)
+    stages = [("contrast", {"value": 70}), ("grayscale", {}), ("luminance", {"value": 60})]
+    untiled, tiled = processor(array), processor(array, SMALL_TILES)
+    untiled.point_operations(stages)
+    tiled.point_operations(stages)
+    np.testing.assert_array_equal(tiled.array, untiled.array)
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("thresholds", [(30, 100), (100, 30), (10, 20), (50, 200), (80, 80), (0, 255)])
+def test_tiled_edges_match_untiled(mode, thresholds):
+    array = make_image(mode)
+    untiled, tiled = processor(array), processor(array, SMALL_TILES)
+    untiled.edges(*thresholds)
+    tiled.edges(*thresholds)
+    assert untiled.array.any()
+    np.testing.assert_array_equal(tiled.array, untiled.array)
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import numpy as np
+import cv2
+
+
+# Réglages par défaut du traitement par tuiles, configurables par variables d'environnement
+TILE_SIZE = int(os.environ.get("TILE_SIZE", 1024))
+# Les images plus petites que ce seuil (en mégapixels) sont traitées d'un seul bloc
+TILE_MIN_MEGAPIXELS = float(os.environ.get("TILE_MIN_MEGAPIXELS", 64))
+# Si ce dossier est défini, les résultats intermédiaires sont stockés dans des fichiers mappés en mémoire
+TILE_SCRATCH_DIR = os.environ.get("TILE_SCRATCH_DIR")
+
+
+# Découper une image de taille (height, width) en tuiles de côté tile_size.
+# Renvoie pour chaque tuile (tranche de la tuile, tranche de la tuile élargie du halo)
+def iter_tiles(height, width, tile_size, halo):
+    for y0 in range(0, height, tile_size):
+        y1 = min(y0 + tile_size, height)
+        for x0 in range(0, width, tile_size):
+            x1 = min(x0 + tile_size, width)
+            tile = (slice(y0, y1), slice(x0, x1))
+            padded = (slice(max(0, y0 - halo), min(height, y1 + halo)),
+                      slice(max(0, x0 - halo), min(width, x1 + halo)))
+            yield tile, padded
+
+
+# Position de la tuile à l'intérieur de la tuile élargie
+def inner(tile, padded):
+    return tuple(slice(t.start - p.start, t.stop - p.start) for t, p in zip(tile, padded))
+
+
+# Exécution par tuiles des opérations sur de très grandes images.
+# Chaque tuile est traitée avec un halo au moins égal au rayon du filtre : les pixels du centre
+# voient exactement le même voisinage que lors d'un traitement d'un seul bloc, et aux bords de
+# l'image la tuile s'arrête au même endroit que l'image, donc le résultat est identique.
+class TilingConfig:
+    def __init__(self, tile_size=TILE_SIZE, min_megapixels=TILE_MIN_MEGAPIXELS, scratch_dir=TILE_SCRATCH_DIR):
+        self.tile_size = tile_size
+        self.min_pixels = min_megapixels * 1e6
+        self.scratch_dir = scratch_dir
+
+    # Le traitement par tuiles ne vaut la peine que pour les très grandes images
+    def applies(self, array):
+        return array.shape[0] * array.shape[1] >= self.min_pixels
+
+    # Allouer un tableau de résultat, en mémoire ou dans un fichier temporaire mappé en mémoire
+    # (le fichier est supprimé dès sa création et libéré avec le tableau)
+    def allocate(self, shape, dtype):
+        if self.scratch_dir is None:
+            return np.empty(shape, dtype)
+        with tempfile.TemporaryFile(dir=self.scratch_dir) as scratch:
+            return np.memmap(scratch, dtype=dtype, mode="w+", shape=shape)
+
+    # Appliquer func tuile par tuile ; halo est le rayon de voisinage dont func a besoin
+    def run(self, array, func, halo=0):
+        height, width = array.shape[:2]
+        out = None
+        for tile, padded in iter_tiles(height, width, self.tile_size, halo):
+            result = func(array[padded])[inner(tile, padded)]
+            if out is None:
+                # func peut changer le type ou le nombre de canaux (ex. conversion en niveaux de gris)
+                out = self.allocate((height, width) + result.shape[2:], result.dtype)
+            out[tile] = result
+        return out
+
+    def canny(self, gray, threshold1, threshold2):
+        """
+        Canny par tuiles. Le gradient de Sobel (rayon 1) et la suppression des non-maxima (rayon 1)
+        sont locaux : un halo de 2 pixels suffit pour obtenir, tuile par tuile, les pixels candidats
+        (gradient > seuil bas) et les pixels forts (gradient > seuil haut). L'hystérésis, elle, suit des
+        chaînes de pixels de longueur quelconque : elle est propagée de tuile en tuile jusqu'à stabilité.
+        """
+        low, high = sorted((threshold1, threshold2))
+        candidates = self.run(gray, lambda t: cv2.Canny(t, low, low), halo=2)
+        edges = self.run(gray, lambda t: cv2.Canny(t, high, high), halo=2)
+
+        height, width = gray.shape
+        changed = True
+        while changed:
+            changed = False
+            for _, padded in iter_tiles(height, width, self.tile_size, 1):
+                region = edges[padded]
+                _, labels = cv2.connectedComponents(candidates[padded], connectivity=8)
+                # Composantes connexes de candidats qui touchent un contour déjà confirmé
+                seeds = np.unique(labels[region > 0])
+                grown = np.isin(labels, seeds[seeds > 0])
+                if np.count_nonzero(grown) > np.count_nonzero(region):
+                    region[grown] = 255
+                    changed = True
+        return edges
@@ -22,13 +22,16 @@ import axios from 'axios';
 import Chart from 'chart.js/auto';
 
 import './Dashboard.css';
-import { printImage, saveImage } from './ImageUtils';
+import { printImage, saveBlob, saveImage } from './ImageUtils';
 import DynamicToggle from './DynamicToggle';
 import DynamicToggleSlides from './DynamicToggleSlides';
 import DynamicSlider from './DynamicSlider';
+import { editsDelta } from './utils';
 export function Dashboard() {
   const [imageBase64, setImageBase64] = useState<string>('');
   const [originalImageBase64, setoriginalImageBase64] = useState<string>('');
+  // id of the original image stored on the server (see /upload_image)
+  const [imageId, setImageId] = useState<string>('');
 
   const [histogramData, setHistogramData] = useState(null);
   const [showHistogram, setShowHistogram] = useState(false);
@@ -37,31 +40,148 @@ export function Dashboard() {
 
   const [edits, setEdits] = useState<object>({});
 
+  const baseUrl = 'http://localhost:8000';
+  // the edits are previewed on a downscaled copy of the image, the full resolution is only rendered on export
+  const previewMaxEdge = 1024;
+
+  // live edit session (see /ws/edit): the server keeps the preview of the image, only renders the latest
+  // version of the edits and sends it back with its histogram
+  const socketRef = useRef<WebSocket | null>(null);
+  const editsRef = useRef<object>(edits);
+  const sentEditsRef = useRef<object>({});
+  const seqRef = useRef(0);
+  editsRef.current = edits;
+
+  // upload the original image once, the server keeps it and gives back its id
+  const uploadImage = async (base64Image: string) => {
+    const formData = new FormData();
+    formData.append('base64_image', base64Image);
+    const response = await axios.post(baseUrl + '/upload_image', formData);
+    setImageId(response.data.image_id);
+    return response.data.image_id as string;
+  };
+
+  // open the live edit session on the stored image, starting from the current edits
+  const openSession = (socket: WebSocket, id: string) => {
+    sentEditsRef.current = editsRef.current;
+    seqRef.current += 1;
+    socket.send(
+      JSON.stringify({
+        type: 'open',
+        image_id: id,
+        edits: editsRef.current,
+        max_edge: previewMaxEdge,
+        seq: seqRef.current
+      })
+    );
+  };
+
+  useEffect(() => {
+    if (!imageId) {
+      return;
+    }
+    const socket = new WebSocket(baseUrl.replace(/^http/, 'ws') + '/ws/edit');
+    socketRef.current = socket;
+    socket.onopen = () => openSession(socket, imageId);
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'frame') {
+        setImageBase64(message.base64_image);
+        setHistogramData(message.histogram);
+      } else if (message.status === 404) {
+        // the server may have evicted the image: upload it again and reopen the session
+        uploadImage(originalImageBase64)
+          .then((id) => openSession(socket, id))
+          .catch((error) => console.error('Error uploading image:', error));
+      } else {
+        console.error('Live edit error:', message.detail);
+      }
+    };
+    socket.onclose = () => {
+      if (socketRef.current === socket) {
+        socketRef.current = null;
+      }
+    };
+    return () => {
+      if (socketRef.current === socket) {
+        socketRef.current = null;
+      }
+      socket.close();
+    };
+  }, [imageId]);
+
   useEffect(() => {
-    // send the edits object as well as the originalImageBase64 to the backend, then update the imageBase64 with the new image
+    const socket = socketRef.current;
+    if (socket && socket.readyState === WebSocket.CONNECTING) {
+      // the current edits are sent when the session opens
+      return;
+    }
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      // only send what changed: the server skips the versions it has not started rendering yet
+      const delta = editsDelta(sentEditsRef.current, edits);
+      sentEditsRef.current = edits;
+      if (Object.keys(delta).length > 0) {
+        seqRef.current += 1;
+        socket.send(JSON.stringify({ type: 'edit', edits: delta, seq: seqRef.current }));
+      }
+      return;
+    }
+
+    // no live session: send the edits object as well as the id of the original image to the backend, then update the imageBase64 with the new preview
     const sendEditsToBackend = async () => {
-      const baseUrl = 'http://localhost:8000';
       const formData = new FormData();
-      formData.append('base64_image', originalImageBase64);
+      formData.append('image_id', imageId);
       formData.append('edits', JSON.stringify(edits));
+      formData.append('max_edge', String(previewMaxEdge));
       try {
-        const response = await axios.post(baseUrl + '/edit_image', formData);
+        const response = await axios.post(baseUrl + '/preview', formData);
         setImageBase64(response.data.base64_image);
       } catch (error) {
-        console.error('Error sending edits:', error);
+        // the server may have evicted the image: upload it again
+        if (axios.isAxiosError(error) && error.response?.status === 404) {
+          await uploadImage(originalImageBase64);
+        } else {
+          console.error('Error sending edits:', error);
+        }
       }
     };
-    sendEditsToBackend();
-  }, [edits, originalImageBase64]);
+    if (imageId) {
+      sendEditsToBackend();
+    }
+  }, [edits, imageId]);
+
+  // render the edits at full resolution and download the result
+  const exportImage = async () => {
+    if (!imageId) {
+      saveImage(imageBase64);
+      return;
+    }
+    const formData = new FormData();
+    formData.append('image_id', imageId);
+    formData.append('edits', JSON.stringify(edits));
+    try {
+      const response = await axios.post(baseUrl + '/export', formData, {
+        responseType: 'blob'
+      });
+      saveBlob(response.data);
+    } catch (error) {
+      console.error('Error exporting image:', error);
+    }
+  };
 
   // ------------ HISTOGRAM -----------------------------------------
 
   const handleHistogram = () => {
+    if (!imageId) {
+      return;
+    }
     const formData = new FormData();
-    formData.append('base64_image', imageBase64);
+    formData.append('image_id', imageId);
+    formData.append('edits', JSON.stringify(edits));
+    formData.append('max_edge', String(previewMaxEdge));
 
     axios
-      .post('http://localhost:8000/histogram', formData)
+      .post(baseUrl + '/histogram/', formData)
       .then((response) => {
         setHistogramData(response.data);
       })
@@ -152,7 +272,10 @@ export function Dashboard() {
   };
 
   useEffect(() => {
-    handleHistogram();
+    // the live session already sends the histogram along with each preview
+    if (socketRef.current?.readyState !== WebSocket.OPEN) {
+      handleHistogram();
+    }
   }, [imageBase64]);
 
   useEffect(() => {
@@ -279,6 +402,9 @@ export function Dashboard() {
                       reader.onload = (e) => {
                         setImageBase64(e.target?.result as string);
                         setoriginalImageBase64(e.target?.result as string);
+                        uploadImage(e.target?.result as string).catch(
+                          (error) => console.error('Error uploading image:', error)
+                        );
                       };
                       reader.readAsDataURL(file);
                     }
@@ -292,7 +418,7 @@ export function Dashboard() {
                 size="sm"
                 className="m-1 gap-1.5 text-sm"
                 onClick={() => {
-                  saveImage(imageBase64);
+                  exportImage();
                 }}
               >
                 <Download className="size-3.5" />
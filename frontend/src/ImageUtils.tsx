@@ -36,4 +36,10 @@ export const printImage = (imageBase64: string | null) => {
     link.download = 'image.png';
     link.click();
   };
-  
\ No newline at end of file
+
+  export const saveBlob = (blob: Blob) => {
+    const link = document.createElement('a');
+    link.href = URL.createObjectURL(blob);
+    link.download = 'image.' + (blob.type.split('/')[1] || 'png');
+    link.click();
+  };
@@ -1,3 +1,22 @@
 export function capitalizeFirstLetter(s: string): string {
   return s.charAt(0).toUpperCase() + s.slice(1);
 }
+
+// edits that changed between two versions of the recipe, as sent to the live edit session (see /ws/edit):
+// the methods whose arguments changed, and null for the methods that were removed
+export function editsDelta(previous: object, current: object) {
+  const before = previous as Record<string, unknown>;
+  const after = current as Record<string, unknown>;
+  const delta: Record<string, unknown> = {};
+  for (const key of Object.keys(after)) {
+    if (JSON.stringify(before[key]) !== JSON.stringify(after[key])) {
+      delta[key] = after[key];
+    }
+  }
+  for (const key of Object.keys(before)) {
+    if (!(key in after)) {
+      delta[key] = null;
+    }
+  }
+  return delta;
+}